@@ -290,6 +290,7 @@
 import os
 import json
 import shutil
+import asyncio
 from typing import List, Optional
 from datetime import datetime, timedelta
 from collections import Counter
@@ -299,16 +300,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
 
 # ================= INTERNAL IMPORTS =================
 from backend.batch_processor import BatchProcessor
+from backend.ingestion_pipeline import DocumentIngestion, get_progress
+from backend.embeddings import close_async_sessions, get_embedding_metrics
 from backend.search_engine import SearchEngine
 from backend.qa_engine import QAEngine
 from backend.vector_db import VectorDatabase
 from backend.session_manager import SessionManager
 from backend.api.schemas import QueryRequest, QueryResponse
 from backend.api.session import router as session_router
-from utils.error_handler import validate_pdf, validate_query
+from utils.error_handler import validate_pdf, validate_query, ValidationError
 
 # ================= APP SETUP =================
 app = FastAPI(
@@ -346,6 +350,12 @@ app.add_middleware(
 # ================= ROUTERS =================
 app.include_router(session_router)
 
+# ================= SHUTDOWN =================
+@app.on_event("shutdown")
+async def shutdown():
+    # Pooled HTTP session used by async embedding calls
+    await close_async_sessions()
+
 # ================= LOAD USERS =================
 if os.path.exists(USER_DB_FILE):
     try:
@@ -478,6 +488,39 @@ async def upload(files: List[UploadFile] = File(...), user: str = Query(...)):
 
     return {"uploaded": uploaded}
 
+# ================= UPLOAD + INGEST =================
+def write_upload(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+@app.post("/upload-and-ingest")
+async def upload_and_ingest(file: UploadFile = File(...), user: str = Query(...)):
+    # One read of the upload: hashing, validation and extraction all use this buffer
+    try:
+        validate_pdf(file)
+    except ValidationError as e:
+        raise HTTPException(400, str(e))
+
+    data = await file.read()
+    if not data.startswith(b"%PDF-"):
+        raise HTTPException(400, "Uploaded file is not a PDF")
+
+    user_dir = os.path.join(UPLOAD_DIR, user)
+    os.makedirs(user_dir, exist_ok=True)
+    path = os.path.join(user_dir, file.filename)
+
+    def ingest_buffer():
+        return DocumentIngestion(user=user).process_single_document(path, data=data)
+
+    # Persist to disk concurrently with ingestion instead of before it
+    persist = asyncio.create_task(asyncio.to_thread(write_upload, path, data))
+    try:
+        result = await run_in_threadpool(ingest_buffer)
+    finally:
+        await persist
+
+    return {"uploaded": file.filename, **result}
+
 # ================= LIST UPLOADS (RESTORED) =================
 @app.get("/list-uploads")
 def list_uploads(user: str):
@@ -517,6 +560,14 @@ def ingest(user: str = Query(...)):
     BatchProcessor(user=user, max_workers=3).process_files_parallel(pdfs)
     return {"status": "ingested", "files": len(pdfs)}
 
+@app.get("/ingest-progress")
+def ingest_progress(user: str, file: str):
+    # Pages up to pages_done are already searchable while the rest is indexed
+    progress = get_progress(user, os.path.basename(file))
+    if progress is None:
+        raise HTTPException(404, "No ingestion recorded for this file")
+    return progress
+
 ## ================= ANALYTICS =================
 @app.get("/analytics-data")
 def analytics(user: str):
@@ -590,21 +641,26 @@ def analytics(user: str):
     }
 # ================= QUERY (RESTORED) =================
 @app.post("/query", response_model=QueryResponse)
-def query(req: QueryRequest):
+async def query(req: QueryRequest):
     validate_query(req.query)
 
-    search_engine = SearchEngine(user=req.user)
+    # Opens the Chroma client and, on first use, loads the embedding cache:
+    # blocking work, kept off the event loop
+    search_engine = await run_in_threadpool(SearchEngine, user=req.user)
 
-    chunks = search_engine.search_similar_chunks(
+    # Query embedding is awaited; no worker thread is held during the API call
+    chunks = await search_engine.asearch_similar_chunks(
         query=req.query,
         k=8
     )
 
-    result = qa_engine.generate_answer(req.query, chunks)
+    result = await run_in_threadpool(qa_engine.generate_answer, req.query, chunks)
 
-    sid = req.session_id or session_manager.create_session(req.user)
+    # Session files are read and written in a worker thread too
+    sid = req.session_id or await run_in_threadpool(session_manager.create_session, req.user)
 
-    session_manager.append_to_session(
+    await run_in_threadpool(
+        session_manager.append_to_session,
         user=req.user,
         session_id=sid,
         question=req.query,
@@ -634,3 +690,9 @@ def health():
             "openai": "Connected" if os.getenv("OPENAI_API_KEY") else "Missing"
         }
     }
+
+# ================= METRICS =================
+@app.get("/metrics/embeddings")
+def embedding_metrics():
+    # Latency, batch size, token, retry, rate-limit wait and cache counters per model
+    return get_embedding_metrics()
@@ -0,0 +1,334 @@
+import os
+import json
+import mmap
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+# Index record header: key length, vector dimension, byte offset into the data file
+_RECORD_HEADER = struct.Struct("<HIQ")
+_VECTOR_DTYPE = np.dtype("<f4")
+
+# Memory budget for decoded vectors kept hot in RAM (per process, per store)
+DEFAULT_MEMORY_MB = float(os.getenv("EMBEDDING_CACHE_MEMORY_MB", 64))
+
+
+@contextmanager
+def _file_lock(f):
+    """
+    Exclusive lock on an open file, held across processes (API workers, the
+    Streamlit frontend) that share the same store.
+    """
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+
+    # Windows: byte-range lock on the first byte (LK_LOCK retries for ~10s)
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    try:
+        yield
+    finally:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingCache:
+    """
+    Persistent, append-only embedding store.
+
+    Layout on disk:
+    - <name>.bin : packed little-endian float32 vectors, appended in write order
+    - <name>.idx : append-only log of (key, dimension, offset) records
+
+    Inserts append one vector and one index record, so existing data is
+    never rewritten. Only the small index is parsed at start-up; vectors are
+    read on demand through a memory map of the data file.
+
+    Several processes may share the files: appends hold an exclusive lock
+    on <name>.lock and take their offset from the data file's real size,
+    and a lookup that misses first reads index records other processes
+    appended since.
+
+    Recently used vectors are kept decoded in an LRU tier bounded by
+    max_memory_mb; hit/miss/eviction counters are exposed through stats().
+    """
+
+    def __init__(self, path="data/embedding_cache.bin", legacy_json_path=None, max_memory_mb=DEFAULT_MEMORY_MB):
+        self.data_path = path
+        self.index_path = os.path.splitext(path)[0] + ".idx"
+        self.lock_path = os.path.splitext(path)[0] + ".lock"
+        self.index = {}
+
+        self._lock = threading.Lock()
+        self._mmap = None
+        # Bytes of the index log already read into self.index
+        self._index_position = 0
+
+        # LRU tier: key -> float32 array, oldest first
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(self.data_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock_file = open(self.lock_path, "a+b")
+        self._data_file = open(self.data_path, "ab")
+        self._index_file = open(self.index_path, "ab")
+
+        self._load_index()
+
+        if legacy_json_path:
+            self._migrate_json(legacy_json_path)
+
+    # -------------------------
+    # Loading
+    # -------------------------
+    def _load_index(self):
+        """
+        Rebuild the key → (offset, dimension) map from the index log.
+        A truncated trailing record or one pointing past the end of the data
+        file (a writer that crashed mid-append) is cut off.
+        """
+        with _file_lock(self._lock_file):
+            self._read_index_tail()
+
+            if self._index_position < os.path.getsize(self.index_path):
+                with open(self.index_path, "r+b") as f:
+                    f.truncate(self._index_position)
+
+    def _read_index_tail(self):
+        """
+        Add index records appended since the last read (by this or another
+        process) to self.index. Stops before an incomplete record.
+        """
+        data_size = os.fstat(self._data_file.fileno()).st_size
+
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_position)
+            raw = f.read()
+
+        position = 0
+        header_size = _RECORD_HEADER.size
+
+        while position + header_size <= len(raw):
+            key_length, dimension, offset = _RECORD_HEADER.unpack_from(raw, position)
+            key_end = position + header_size + key_length
+            if key_end > len(raw):
+                break
+
+            if offset + dimension * _VECTOR_DTYPE.itemsize > data_size:
+                break
+
+            key = raw[position + header_size:key_end].decode("utf-8")
+            self.index[key] = (offset, dimension)
+            position = key_end
+
+        self._index_position += position
+
+    def _refresh_index(self):
+        # Cheap check first: only re-read when the log has grown
+        if os.fstat(self._index_file.fileno()).st_size > self._index_position:
+            self._read_index_tail()
+
+    def _migrate_json(self, json_path):
+        """
+        One-time import of the legacy JSON cache ({key: [floats]}).
+        The JSON file is renamed afterwards so the import does not repeat.
+        """
+        if not os.path.exists(json_path):
+            return
+
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            # Keep the file: it may be recoverable, and the import retries next start
+            logger.error(f"Could not read legacy embedding cache {json_path}, not migrated: {e}")
+            return
+
+        for key, embedding in legacy.items():
+            if key not in self.index:
+                self.put(key, embedding)
+
+        os.replace(json_path, json_path + ".migrated")
+
+    # -------------------------
+    # Read / Write
+    # -------------------------
+    def _view(self, offset, dimension):
+        end = offset + dimension * _VECTOR_DTYPE.itemsize
+
+        if self._mmap is None or end > len(self._mmap):
+            # The data file has grown since it was mapped
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.data_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return np.frombuffer(self._mmap, dtype=_VECTOR_DTYPE, count=dimension, offset=offset)
+
+    def _remember(self, key, vector):
+        """
+        Put a vector in the LRU tier and evict the oldest ones over budget.
+        """
+        if vector.nbytes > self.max_memory_bytes:
+            return
+
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """
+        Return the cached vector for key as a list of floats.
+        """
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+
+            entry = self.index.get(key)
+            if entry is None:
+                # Another process may have stored it since
+                self._refresh_index()
+                entry = self.index.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            # Copy off the map so remapping is never blocked by live views
+            vector = self._view(*entry).copy()
+            self.disk_hits += 1
+            self._remember(key, vector)
+            return vector.tolist()
+
+    def put(self, key, embedding):
+        """
+        Append a vector to the store (O(1), no rewrite of existing data).
+        """
+        vector = np.asarray(embedding, dtype=_VECTOR_DTYPE)
+        key_bytes = key.encode("utf-8")
+
+        with self._lock, _file_lock(self._lock_file):
+            # Catch up with other processes' appends, so our position stays at the log's end
+            self._refresh_index()
+
+            # The real end of the file, wherever other processes left it
+            offset = os.fstat(self._data_file.fileno()).st_size
+
+            self._data_file.write(vector.tobytes())
+            self._data_file.flush()
+
+            # Index record goes last: a crash in between leaves an orphan vector, not a bad key
+            self._index_file.write(_RECORD_HEADER.pack(len(key_bytes), vector.shape[0], offset) + key_bytes)
+            self._index_file.flush()
+            self._index_position = os.fstat(self._index_file.fileno()).st_size
+
+            self.index[key] = (offset, vector.shape[0])
+            self._remember(key, vector)
+
+    def stats(self):
+        """
+        Size accounting and hit/miss/eviction counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+
+            return {
+                "entries": len(self.index),
+                "disk_bytes": os.fstat(self._data_file.fileno()).st_size,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, key):
+        embedding = self.get(key)
+        if embedding is None:
+            raise KeyError(key)
+        return embedding
+
+    def __setitem__(self, key, embedding):
+        self.put(key, embedding)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._data_file.close()
+            self._index_file.close()
+            self._lock_file.close()
+
+
+# -------------------------
+# Process-wide Store Registry
+# -------------------------
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path="data/embedding_cache.bin", legacy_json_path=None, max_memory_mb=DEFAULT_MEMORY_MB):
+    """
+    Return the single EmbeddingCache for a path in this process.
+    Two stores appending to the same files would corrupt each other's offsets,
+    and one shared LRU tier keeps memory flat however many callers exist.
+    The first caller's max_memory_mb applies.
+    """
+    key = os.path.abspath(path)
+
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = EmbeddingCache(path, legacy_json_path=legacy_json_path, max_memory_mb=max_memory_mb)
+            _caches[key] = cache
+        return cache
@@ -0,0 +1,154 @@
+import time
+import bisect
+import threading
+
+
+# Upper bounds of the latency buckets, in seconds (last bucket is +inf)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Upper bounds of the batch-size buckets, in inputs per request
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2048)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (cumulative counts, like Prometheus).
+    Not thread-safe on its own; EmbeddingMetrics holds the lock.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = {}
+
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+            "buckets": buckets
+        }
+
+
+class EmbeddingMetrics:
+    """
+    Thread-safe counters and histograms for one EmbeddingGenerator.
+
+    Separates time spent in provider calls from time spent waiting on the
+    rate limiter, backing off between retries and serving the cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+
+            self.calls = 0
+            self.chunks = 0
+            self.requests = 0
+            self.failed_requests = 0
+            self.inputs_sent = 0
+            self.tokens_sent = 0
+            self.retries = 0
+            self.retry_sleep_seconds = 0.0
+            self.rate_limit_waits = 0
+            self.rate_limit_wait_seconds = 0.0
+            self.cache_hits = 0
+            self.cache_misses = 0
+            self.shared_inflight = 0
+
+            # Whole generate_*batch_embeddings() call, cache and waits included
+            self.call_latency = Histogram(LATENCY_BUCKETS)
+            # One provider request attempt, excluding rate-limit waits
+            self.request_latency = Histogram(LATENCY_BUCKETS)
+            self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+
+    # -------------------------
+    # Recording
+    # -------------------------
+    def record_call(self, chunks, seconds):
+        with self._lock:
+            self.calls += 1
+            self.chunks += chunks
+            self.call_latency.observe(seconds)
+
+    def record_lookup(self, hits, misses, shared=0):
+        with self._lock:
+            self.cache_hits += hits
+            self.cache_misses += misses
+            self.shared_inflight += shared
+
+    def record_request(self, inputs, tokens, seconds, failed=False):
+        with self._lock:
+            self.request_latency.observe(seconds)
+
+            if failed:
+                self.failed_requests += 1
+                return
+
+            self.requests += 1
+            self.inputs_sent += inputs
+            self.tokens_sent += tokens
+            self.batch_size.observe(inputs)
+
+    def record_retry(self, sleep_seconds):
+        with self._lock:
+            self.retries += 1
+            self.retry_sleep_seconds += sleep_seconds
+
+    def record_rate_limit_wait(self, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.rate_limit_waits += 1
+            self.rate_limit_wait_seconds += seconds
+
+    # -------------------------
+    # Reading
+    # -------------------------
+    def snapshot(self):
+        """
+        Point-in-time copy of every counter and histogram as plain dicts.
+        """
+        with self._lock:
+            lookups = self.cache_hits + self.cache_misses
+
+            return {
+                "uptime_seconds": round(time.time() - self.started, 3),
+                "calls": self.calls,
+                "chunks": self.chunks,
+                "requests": self.requests,
+                "failed_requests": self.failed_requests,
+                "inputs_sent": self.inputs_sent,
+                "tokens_sent": self.tokens_sent,
+                "retries": self.retries,
+                "retry_sleep_seconds": round(self.retry_sleep_seconds, 6),
+                "rate_limit_waits": self.rate_limit_waits,
+                "rate_limit_wait_seconds": round(self.rate_limit_wait_seconds, 6),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_hit_ratio": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+                "shared_inflight": self.shared_inflight,
+                "call_latency_seconds": self.call_latency.snapshot(),
+                "request_latency_seconds": self.request_latency.snapshot(),
+                "batch_size": self.batch_size.snapshot()
+            }
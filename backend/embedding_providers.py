@@ -0,0 +1,271 @@
+import os
+import re
+import hashlib
+
+import numpy as np
+import openai
+from dotenv import load_dotenv
+
+from backend.tokenizer import get_encoder
+
+
+# -------------------------
+# Model Registry
+# -------------------------
+# version changes whenever a model's vectors change, so stale cache entries are never served.
+# legacy_namespace: key prefix used before keys were namespaced by model ("" = bare digest).
+EMBEDDING_MODELS = {
+    "text-embedding-ada-002": {
+        "provider": "openai", "version": "2", "dimension": 1536, "max_input_tokens": 8191,
+        "legacy_namespace": ""
+    },
+    "text-embedding-3-small": {
+        "provider": "openai", "version": "1", "dimension": 1536, "max_input_tokens": 8191
+    },
+    "text-embedding-3-large": {
+        "provider": "openai", "version": "1", "dimension": 3072, "max_input_tokens": 8191
+    },
+    "local-hash": {
+        "provider": "local", "version": "1", "dimension": 1536, "max_input_tokens": 8191
+    },
+}
+
+DEFAULT_MODEL = "text-embedding-ada-002"
+
+
+def register_embedding_model(name, provider, dimension, version="1", max_input_tokens=8191):
+    """
+    Declare an embedding model so it can be selected by name.
+    """
+    EMBEDDING_MODELS[name] = {
+        "provider": provider,
+        "version": str(version),
+        "dimension": dimension,
+        "max_input_tokens": max_input_tokens
+    }
+
+
+def get_model_spec(model_name):
+    if model_name not in EMBEDDING_MODELS:
+        raise ValueError(f"Unknown embedding model: {model_name}")
+    return EMBEDDING_MODELS[model_name]
+
+
+class EmbeddingProvider:
+    """
+    Interface between EmbeddingGenerator and an embedding backend.
+
+    A provider only turns a list of texts into a list of vectors (same order).
+    Caching, batching, retries and rate limiting stay in EmbeddingGenerator.
+    Dimension and input limits come from the model registry.
+    """
+
+    name = "base"
+    # Remote providers draw from the shared API rate limiter
+    rate_limited = False
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.spec = get_model_spec(model_name)
+
+    @property
+    def dimension(self):
+        return self.spec["dimension"]
+
+    @property
+    def max_input_tokens(self):
+        # Largest single input the backend accepts, in its own tokens
+        return self.spec["max_input_tokens"]
+
+    @property
+    def cache_namespace(self):
+        # Cache keys are "<model>@<version>:<sha256>", so models sit side by side
+        return f"{self.model_name}@{self.spec['version']}"
+
+    @property
+    def legacy_cache_namespace(self):
+        return self.spec.get("legacy_namespace")
+
+    def count_tokens(self, text):
+        """
+        Token count used for request packing (~4 characters per token).
+        """
+        return max(1, len(text) // 4)
+
+    def split_text(self, text, max_tokens):
+        """
+        Split text into pieces of at most max_tokens tokens.
+        Returns (piece_text, token_count) pairs.
+        """
+        step = max_tokens * 4
+        return [
+            (text[i:i + step], self.count_tokens(text[i:i + step]))
+            for i in range(0, len(text), step)
+        ]
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+    async def aembed(self, texts, session=None):
+        """
+        Async variant of embed(). Local providers are CPU-bound and fast,
+        so the default just calls embed().
+        """
+        return self.embed(texts)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    OpenAI embeddings API (text-embedding-ada-002 by default; any registered
+    "openai" model can be used).
+    """
+
+    name = "openai"
+    rate_limited = True
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        super().__init__(model_name)
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")
+
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY not found in .env")
+
+        openai.api_key = api_key
+
+    @property
+    def encoder(self):
+        # Shared process-wide, loaded on first use (tiktoken fetches the BPE file once)
+        return get_encoder(self.model_name)
+
+    def count_tokens(self, text):
+        return len(self.encoder.encode(text))
+
+    def split_text(self, text, max_tokens):
+        tokens = self.encoder.encode(text)
+        pieces = []
+
+        for start in range(0, len(tokens), max_tokens):
+            window = tokens[start:start + max_tokens]
+            pieces.append((self.encoder.decode(window), len(window)))
+
+        return pieces
+
+    def _vectors(self, response):
+        data = sorted(response["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    def embed(self, texts):
+        response = openai.Embedding.create(
+            model=self.model_name,
+            input=texts
+        )
+        return self._vectors(response)
+
+    async def aembed(self, texts, session=None):
+        # Reuse the caller's pooled aiohttp session for this request
+        session_token = openai.aiosession.set(session)
+        try:
+            response = await openai.Embedding.acreate(
+                model=self.model_name,
+                input=texts
+            )
+        finally:
+            openai.aiosession.reset(session_token)
+
+        return self._vectors(response)
+
+
+class LocalHashEmbeddingProvider(EmbeddingProvider):
+    """
+    Offline, deterministic embeddings for tests and benchmarks.
+
+    Signed feature hashing over lowercase word tokens: each token is hashed
+    (blake2b, so results do not depend on PYTHONHASHSEED) to a dimension and
+    a sign, counts are accumulated with NumPy and rows are L2-normalised.
+    Texts sharing vocabulary get a positive cosine similarity.
+    """
+
+    name = "local"
+
+    _TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, model_name="local-hash", seed=0):
+        super().__init__(model_name)
+        self.seed = seed
+        self._salt = seed.to_bytes(8, "little")
+
+    @property
+    def cache_namespace(self):
+        # Different seeds give different vectors, so they must not share cache keys
+        return f"{super().cache_namespace}+seed{self.seed}"
+
+    def _hash_tokens(self, tokens):
+        return np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8, salt=self._salt).digest(), "little")
+                for t in tokens
+            ),
+            dtype=np.uint64,
+            count=len(tokens)
+        )
+
+    def embed(self, texts):
+        token_lists = [self._TOKEN_PATTERN.findall(text.lower()) for text in texts]
+        lengths = np.fromiter((len(t) for t in token_lists), dtype=np.int64, count=len(texts))
+        all_tokens = [token for tokens in token_lists for token in tokens]
+
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+
+        if all_tokens:
+            # Hash each distinct token once, then scatter all occurrences
+            vocabulary, inverse = np.unique(np.array(all_tokens, dtype=object), return_inverse=True)
+            hashes = self._hash_tokens(vocabulary.tolist())[inverse]
+
+            columns = (hashes % np.uint64(self.dimension)).astype(np.int64)
+            signs = np.where((hashes >> np.uint64(63)) == 1, -1.0, 1.0).astype(np.float32)
+            rows = np.repeat(np.arange(len(texts)), lengths)
+
+            np.add.at(vectors, (rows, columns), signs)
+
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+        return vectors.tolist()
+
+
+# -------------------------
+# Provider Selection
+# -------------------------
+PROVIDERS = {
+    "openai": OpenAIEmbeddingProvider,
+    "local": LocalHashEmbeddingProvider,
+}
+
+
+def get_embedding_provider(name=None, model_name=None):
+    """
+    Build a provider for a registered model.
+
+    model_name defaults to EMBEDDING_MODEL or text-embedding-ada-002.
+    name (or EMBEDDING_PROVIDER) must match the model's provider; "local"
+    without a model selects the offline local-hash model.
+    """
+    name = (name or os.getenv("EMBEDDING_PROVIDER", "")).lower()
+
+    if name == "local" and model_name is None and not os.getenv("EMBEDDING_MODEL"):
+        model_name = "local-hash"
+
+    model_name = model_name or os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+    model_provider = get_model_spec(model_name)["provider"]
+    name = name or model_provider
+
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {name}")
+
+    if name != model_provider:
+        raise ValueError(
+            f"Embedding model {model_name} belongs to provider {model_provider}, not {name}"
+        )
+
+    return PROVIDERS[name](model_name=model_name)
@@ -1,63 +1,141 @@
 import time
-import json
+import random
+import asyncio
 import hashlib
+import weakref
+import threading
+import concurrent.futures
 from datetime import datetime
+import aiohttp
+import numpy as np
 import openai
-from dotenv import load_dotenv
 import os
 
+from backend.embedding_cache import get_embedding_cache, DEFAULT_MEMORY_MB
+from backend.embedding_metrics import EmbeddingMetrics
+from backend.embedding_providers import get_embedding_provider
+from backend.rate_limiter import get_rate_limiter
+
+
+# OpenAI accepts many inputs per embedding request; these bound a single request
+# (item count and total tokens across its inputs)
+MAX_BATCH_SIZE = 100
+MAX_BATCH_TOKENS = 100000
+
+# Upper bound on in-flight async embedding requests per event loop
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_EMBEDDING_CONCURRENCY", 8))
+
+
+# -------------------------
+# Per-Event-Loop Async State
+# -------------------------
+# One pooled HTTP session and one concurrency semaphore per event loop,
+# shared by every EmbeddingGenerator running on that loop.
+_loop_state = weakref.WeakKeyDictionary()
+
+
+def _get_loop_state():
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+
+    if state is None or state["session"].closed:
+        state = {
+            "session": aiohttp.ClientSession(),
+            "semaphore": asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        }
+        _loop_state[loop] = state
+
+    return state
+
+
+async def close_async_sessions():
+    """
+    Close the pooled HTTP session of the running event loop.
+    Call before the loop shuts down (app shutdown, end of asyncio.run).
+    """
+    state = _loop_state.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state["session"].close()
+
 
 class EmbeddingGenerator:
     """
-    Generates embeddings for text chunks using OpenAI embedding model.
+    Generates embeddings for text chunks through a pluggable provider
+    (OpenAI by default, or the offline "local" backend).
     Implements:
     - single embedding
-    - batch embeddings
-    - caching
-    - retry with exponential backoff
-    - rate limiting (60 req/min)
+    - batch embeddings (many texts per request)
+    - persistent caching (append-only float32 store)
+    - retry with exponential backoff (jittered for async calls)
+    - asyncio variants with bounded concurrency
+    - single-flight: concurrent callers asking for the same text share one request
+    - rate limiting (process-wide request + token budget)
+    - metrics: latency histograms, batch sizes, tokens, retries, waits (metrics_snapshot())
     """
 
-    def __init__(self, model_name="text-embedding-ada-002", cache_path="data/embedding_cache.json"):
-        load_dotenv()
-        api_key = os.getenv("OPENAI_API_KEY")
+    def __init__(
+        self,
+        model_name=None,
+        cache_path="data/embedding_cache.bin",
+        legacy_cache_path="data/embedding_cache.json",
+        provider=None,
+        cache_memory_mb=DEFAULT_MEMORY_MB
+    ):
+        # Provider instance, provider name, or None to follow the model registry
+        # (model_name defaults to EMBEDDING_MODEL / text-embedding-ada-002)
+        if provider is None or isinstance(provider, str):
+            provider = get_embedding_provider(provider, model_name=model_name)
 
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY not found in .env")
-
-        openai.api_key = api_key
-        self.model_name = model_name
+        self.provider = provider
+        self.model_name = provider.model_name
+        self.dimension = provider.dimension
         self.cache_path = cache_path
-        self.cache = self._load_cache()
+        # Append-only float32 store shared by every generator in the process,
+        # with a size-bounded LRU tier; imports the old JSON cache on first use
+        self.cache = get_embedding_cache(
+            cache_path,
+            legacy_json_path=legacy_cache_path,
+            max_memory_mb=cache_memory_mb
+        )
+        # Shared with every other embedding caller in the process
+        self.rate_limiter = get_rate_limiter("embeddings")
+
+        # Single-flight: text key -> Future of the request currently fetching it
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+        self.metrics = EmbeddingMetrics()
 
     # -------------------------
     # Cache Helpers
     # -------------------------
-    def _load_cache(self):
-        try:
-            with open(self.cache_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-        except Exception:
-            return {}
-
-    def _save_cache(self):
-        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
-        with open(self.cache_path, "w", encoding="utf-8") as f:
-            json.dump(self.cache, f)
-
     def _hash_text(self, text: str) -> str:
-        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    # -------------------------
-    # Rate Limit Delay
-    # -------------------------
-    def add_delay(self, seconds=1):
+        # "<model>@<version>:<digest>" keeps several models side by side in one store
+        return f"{self.provider.cache_namespace}:{digest}"
+
+    def _cache_get(self, key):
         """
-        Adds delay between API requests to respect rate limits.
+        Look up a namespaced key, falling back to the key format this model
+        used before namespacing (entries written by older versions).
         """
-        time.sleep(seconds)
+        embedding = self.cache.get(key)
+        legacy_namespace = self.provider.legacy_cache_namespace
+
+        if embedding is None and legacy_namespace is not None:
+            digest = key.rsplit(":", 1)[1]
+            embedding = self.cache.get(f"{legacy_namespace}:{digest}" if legacy_namespace else digest)
+
+        return embedding
+
+    def _acquire(self, tokens):
+        if self.provider.rate_limited:
+            self.metrics.record_rate_limit_wait(self.rate_limiter.acquire(tokens=tokens))
+
+    async def _aacquire(self, tokens):
+        if self.provider.rate_limited:
+            self.metrics.record_rate_limit_wait(await self.rate_limiter.acquire_async(tokens=tokens))
 
     # -------------------------
     # Retry Logic
@@ -74,6 +152,7 @@ class EmbeddingGenerator:
             except Exception as e:
                 if attempt == retries - 1:
                     raise RuntimeError(f"API request failed after {retries} attempts: {e}")
+                self.metrics.record_retry(delay)
                 time.sleep(delay)
                 delay *= 2
 
@@ -85,57 +164,411 @@ class EmbeddingGenerator:
         Generate single embedding vector for text.
         Uses caching to avoid regenerating.
         """
-        if not text or not text.strip():
-            raise ValueError("Text is empty, cannot generate embedding")
+        return self.generate_batch_embeddings([{"text": text}])[0]["embedding"]
 
-        text_key = self._hash_text(text.strip())
+    def _embed_texts(self, texts, tokens):
+        """
+        Embed several texts with a single provider request.
+        Returned vectors are ordered like the input texts.
+        """
+        def api_call():
+            # Every attempt, retries included, is charged to the shared budget
+            self._acquire(tokens)
 
-        # Return cached embedding if exists
-        if text_key in self.cache:
-            return self.cache[text_key]
+            start = time.perf_counter()
+            try:
+                embeddings = self.provider.embed(texts)
+            except Exception:
+                self.metrics.record_request(len(texts), tokens, time.perf_counter() - start, failed=True)
+                raise
 
-        def api_call():
-            return openai.Embedding.create(
-                model=self.model_name,
-                input=text
+            self.metrics.record_request(len(texts), tokens, time.perf_counter() - start)
+            return embeddings
+
+        embeddings = self._retry_request(api_call)
+        return self._verify_embeddings(embeddings, len(texts))
+
+    def _verify_embeddings(self, embeddings, expected_count):
+        """
+        Verify vector count and dimension of a provider response.
+        """
+        if len(embeddings) != expected_count:
+            raise RuntimeError(
+                f"Embedding count mismatch: sent {expected_count}, got {len(embeddings)}"
             )
 
-        response = self._retry_request(api_call)
-        embedding = response["data"][0]["embedding"]
+        for embedding in embeddings:
+            if len(embedding) != self.dimension:
+                raise RuntimeError(
+                    f"Embedding dimension mismatch: expected {self.dimension}, got {len(embedding)}"
+                )
 
-        # Dimension verification
-        if len(embedding) != 1536:
-            raise RuntimeError(f"Embedding dimension mismatch: expected 1536, got {len(embedding)}")
+        return embeddings
 
-        # Save in cache
-        self.cache[text_key] = embedding
-        self._save_cache()
+    def _estimate_tokens(self, chunk):
+        """
+        Token count used for packing. Prefers the chunker's token_count
+        metadata and only tokenizes chunks that do not carry it.
+        """
+        token_count = chunk.get("token_count")
+        if token_count:
+            return token_count
+        return self.provider.count_tokens(chunk.get("text", ""))
 
-        return embedding
+    def _item_token_limit(self, max_batch_tokens):
+        return min(max_batch_tokens, self.provider.max_input_tokens)
+
+    def _split_oversized(self, items, max_batch_tokens):
+        """
+        Expand owned items into request pieces. Items above the per-input
+        limit are split into token windows; their vectors are recombined in
+        _store_batch.
+        """
+        limit = self._item_token_limit(max_batch_tokens)
+        pieces = []
+
+        for item in items:
+            if item["tokens"] <= limit:
+                parts = [(item["text"], item["tokens"])]
+            else:
+                parts = self.provider.split_text(item["text"], limit)
+
+            item["parts"] = [None] * len(parts)
+            item["part_tokens"] = [tokens for _, tokens in parts]
+
+            for part, (text, tokens) in enumerate(parts):
+                pieces.append({"item": item, "part": part, "text": text, "tokens": tokens})
+
+        return pieces
+
+    def _pack_requests(self, pieces, max_batch_size, max_batch_tokens):
+        """
+        Pack pieces into requests by token count (first-fit decreasing), so
+        each request carries as many vectors as the token ceiling allows
+        without exceeding it or max_batch_size items.
+        """
+        requests = []
+
+        for piece in sorted(pieces, key=lambda p: p["tokens"], reverse=True):
+            for request in requests:
+                if len(request["pieces"]) < max_batch_size and request["tokens"] + piece["tokens"] <= max_batch_tokens:
+                    break
+            else:
+                request = {"pieces": [], "tokens": 0}
+                requests.append(request)
+
+            request["pieces"].append(piece)
+            request["tokens"] += piece["tokens"]
+
+        return requests
+
+    def _collect_pending(self, chunks, max_batch_tokens=MAX_BATCH_TOKENS, oversize="split"):
+        """
+        Resolve cache hits and collect the texts that still need a request.
+        Returns (embeddings, pending) where embeddings has None for misses.
+        With oversize="reject", a chunk above the per-input token limit raises
+        ValueError here, before any request is sent.
+        """
+        if oversize not in ("split", "reject"):
+            raise ValueError(f"Unknown oversize policy: {oversize}")
+
+        embeddings = [None] * len(chunks)
+        pending = {}
+        limit = self._item_token_limit(max_batch_tokens)
+
+        for position, chunk in enumerate(chunks):
+            text = chunk.get("text", "")
+
+            if not text or not text.strip():
+                raise ValueError("Text is empty, cannot generate embedding")
+
+            text_key = self._hash_text(text.strip())
+
+            cached = self._cache_get(text_key)
+            if cached is not None:
+                embeddings[position] = cached
+                continue
+
+            # Identical texts in one call share a single request slot
+            if text_key in pending:
+                pending[text_key]["positions"].append(position)
+                continue
+
+            tokens = self._estimate_tokens(chunk)
+            if tokens > limit and oversize == "reject":
+                raise ValueError(
+                    f"Chunk {chunk.get('chunk_id', position)} has {tokens} tokens, "
+                    f"above the per-input limit of {limit}"
+                )
+
+            pending[text_key] = {
+                "key": text_key,
+                "text": text,
+                "tokens": tokens,
+                "positions": [position]
+            }
+
+        return embeddings, pending
+
+    # -------------------------
+    # Single-Flight Coordination
+    # -------------------------
+    def _claim(self, pending, embeddings):
+        """
+        Split pending texts into the ones this caller will request and the
+        ones another thread/task is already requesting.
+        Returns (owned, waiting); waiting holds (future, positions) pairs.
+        """
+        owned = []
+        waiting = []
+
+        with self._inflight_lock:
+            for key, item in pending.items():
+                future = self._inflight.get(key)
+                if future is not None:
+                    waiting.append((future, item["positions"]))
+                    continue
+
+                # Another caller may have finished it since the first cache check
+                embedding = self._cache_get(key)
+                if embedding is not None:
+                    for position in item["positions"]:
+                        embeddings[position] = embedding
+                    continue
 
-    def generate_batch_embeddings(self, chunks, max_requests_per_minute=60):
+                item["future"] = concurrent.futures.Future()
+                self._inflight[key] = item["future"]
+                owned.append(item)
+
+        return owned, waiting
+
+    def _release(self, owned, error=None):
+        """
+        Drop owned keys from the in-flight table; waiters of keys that were
+        never fetched receive the error.
+        """
+        with self._inflight_lock:
+            for item in owned:
+                self._inflight.pop(item["key"], None)
+
+                if not item["future"].done():
+                    item["future"].set_exception(error or RuntimeError("Embedding request was abandoned"))
+
+    def _combine_parts(self, item):
+        """
+        Token-weighted mean of a split item's piece vectors, L2-normalised.
+        """
+        if len(item["parts"]) == 1:
+            return item["parts"][0]
+
+        combined = np.average(np.asarray(item["parts"], dtype=np.float32), axis=0, weights=item["part_tokens"])
+        norm = np.linalg.norm(combined)
+        return (combined / norm if norm else combined).tolist()
+
+    def _store_batch(self, request, vectors, embeddings):
+        for piece, vector in zip(request["pieces"], vectors):
+            item = piece["item"]
+            item["parts"][piece["part"]] = vector
+
+            if any(part is None for part in item["parts"]):
+                continue
+
+            embedding = self._combine_parts(item)
+
+            # Cache first: anyone who misses the in-flight entry must find the vector stored
+            self.cache.put(item["key"], embedding)
+            for position in item["positions"]:
+                embeddings[position] = embedding
+            item["future"].set_result(embedding)
+
+    def _request_texts(self, request):
+        return [piece["text"] for piece in request["pieces"]]
+
+    def _record_lookup(self, embeddings, owned, waiting):
+        # Counted per chunk: filled positions are cache hits, owned ones go to the provider
+        hits = sum(embedding is not None for embedding in embeddings)
+        misses = sum(len(item["positions"]) for item in owned)
+        shared = sum(len(positions) for _, positions in waiting)
+        self.metrics.record_lookup(hits, misses, shared=shared)
+
+    def _fill_waiting(self, future, positions, embeddings):
+        embedding = future.result()
+        for position in positions:
+            embeddings[position] = embedding
+
+    def generate_batch_embeddings(
+        self,
+        chunks,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        oversize="split"
+    ):
         """
         Generate embeddings for multiple chunks with rate limiting.
         Each chunk must contain "text".
+
+        Uncached texts are packed into requests by their token_count (up to
+        max_batch_tokens tokens and max_batch_size items per request). Chunks
+        above the model's per-input limit are split and their vectors averaged
+        (oversize="split") or rejected before any request (oversize="reject").
+        Cache hits cost no request and no wait.
+        Results keep the order of the input chunks.
         """
+        start = time.perf_counter()
+        embeddings, pending = self._collect_pending(chunks, max_batch_tokens, oversize)
+        owned, waiting = self._claim(pending, embeddings)
+        self._record_lookup(embeddings, owned, waiting)
 
-        results = []
-        delay_seconds = 60 / max_requests_per_minute  # ~1 sec per request
+        try:
+            pieces = self._split_oversized(owned, max_batch_tokens)
+            for request in self._pack_requests(pieces, max_batch_size, max_batch_tokens):
+                vectors = self._embed_texts(self._request_texts(request), tokens=request["tokens"])
+                self._store_batch(request, vectors, embeddings)
+        except Exception as e:
+            self._release(owned, e)
+            raise
 
-        for chunk in chunks:
-            text = chunk.get("text", "")
+        self._release(owned)
 
-            embedding = self.generate_embedding(text)
+        # Texts fetched by concurrent callers share their request
+        for future, positions in waiting:
+            self._fill_waiting(future, positions, embeddings)
 
-            results.append({
-                "chunk": chunk,
-                "embedding": embedding
-            })
+        self.metrics.record_call(len(chunks), time.perf_counter() - start)
+
+        return [
+            {"chunk": chunk, "embedding": embedding}
+            for chunk, embedding in zip(chunks, embeddings)
+        ]
+
+    # -------------------------
+    # Async Embedding Generation
+    # -------------------------
+    def _is_retryable(self, error):
+        """
+        Only throttling (429), server-side (5xx) and transport errors are worth retrying.
+        """
+        if isinstance(error, (
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.Timeout,
+            openai.error.APIConnectionError,
+            openai.error.TryAgain
+        )):
+            return True
+
+        status = getattr(error, "http_status", None)
+        return status is not None and (status == 429 or status >= 500)
+
+    async def _aretry_request(self, func, retries=5, base_delay=1, max_delay=30):
+        """
+        Async retry wrapper with exponential backoff and full jitter:
+        each wait is uniform in [0, min(max_delay, base_delay * 2^attempt)].
+        """
+        for attempt in range(retries):
+            try:
+                return await func()
+            except Exception as e:
+                if not self._is_retryable(e) or attempt == retries - 1:
+                    raise RuntimeError(f"API request failed after {attempt + 1} attempts: {e}")
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+                self.metrics.record_retry(delay)
+                await asyncio.sleep(delay)
+
+    async def _aembed_texts(self, texts, tokens):
+        """
+        Async counterpart of _embed_texts, sent over the loop's pooled session
+        and limited by the loop's concurrency semaphore.
+        """
+        state = _get_loop_state()
+
+        async def api_call():
+            await self._aacquire(tokens)
+
+            start = time.perf_counter()
+            try:
+                embeddings = await self.provider.aembed(texts, session=state["session"])
+            except Exception:
+                self.metrics.record_request(len(texts), tokens, time.perf_counter() - start, failed=True)
+                raise
+
+            self.metrics.record_request(len(texts), tokens, time.perf_counter() - start)
+            return embeddings
+
+        async with state["semaphore"]:
+            embeddings = await self._aretry_request(api_call)
+
+        return self._verify_embeddings(embeddings, len(texts))
+
+    async def agenerate_embedding(self, text: str):
+        """
+        Async variant of generate_embedding().
+        """
+        results = await self.agenerate_batch_embeddings([{"text": text}])
+        return results[0]["embedding"]
+
+    async def agenerate_batch_embeddings(
+        self,
+        chunks,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        oversize="split"
+    ):
+        """
+        Async variant of generate_batch_embeddings().
+        All packed requests are issued together; the semaphore and the
+        shared rate limiter decide how many are actually in flight.
+        """
+        start = time.perf_counter()
+        embeddings, pending = self._collect_pending(chunks, max_batch_tokens, oversize)
+        owned, waiting = self._claim(pending, embeddings)
+        self._record_lookup(embeddings, owned, waiting)
+
+        async def run_request(request):
+            vectors = await self._aembed_texts(self._request_texts(request), tokens=request["tokens"])
+            self._store_batch(request, vectors, embeddings)
+
+        try:
+            pieces = self._split_oversized(owned, max_batch_tokens)
+            requests = self._pack_requests(pieces, max_batch_size, max_batch_tokens)
+
+            # A failed request cancels (and waits for) the others, so none of
+            # them stores into a future after _release has failed it
+            async with asyncio.TaskGroup() as group:
+                for request in requests:
+                    group.create_task(run_request(request))
+        except BaseException as e:
+            # Surface the failing request's own error, not the TaskGroup wrapper
+            error = e.exceptions[0] if isinstance(e, BaseExceptionGroup) else e
+            self._release(owned, error if isinstance(error, Exception) else None)
+            raise error
+
+        self._release(owned)
 
-            # Rate limit delay
-            self.add_delay(seconds=delay_seconds)
+        for future, positions in waiting:
+            await asyncio.wrap_future(future)
+            self._fill_waiting(future, positions, embeddings)
 
-        return results
+        self.metrics.record_call(len(chunks), time.perf_counter() - start)
+
+        return [
+            {"chunk": chunk, "embedding": embedding}
+            for chunk, embedding in zip(chunks, embeddings)
+        ]
+
+    # -------------------------
+    # Metrics
+    # -------------------------
+    def metrics_snapshot(self):
+        """
+        Embedding call metrics plus the state of the cache and rate limiter.
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot["model"] = self.model_name
+        snapshot["provider"] = self.provider.name
+        snapshot["cache"] = self.cache.stats()
+        snapshot["rate_limiter"] = self.rate_limiter.headroom() if self.provider.rate_limited else None
+        return snapshot
 
     # -------------------------
     # Prepare Embedding Data Output
@@ -151,11 +584,12 @@ class EmbeddingGenerator:
             embedding = item["embedding"]
 
             # Dimension check again
-            if len(embedding) != 1536:
+            if len(embedding) != self.dimension:
                 raise RuntimeError("Invalid embedding dimension during prepare step")
 
             final_data.append({
                 "embedding_vector": embedding,
+                "embedding_model": self.model_name,
                 "text": chunk.get("text", ""),
                 "metadata": {
                     "chunk_id": chunk.get("chunk_id"),
@@ -164,9 +598,48 @@ class EmbeddingGenerator:
                     "page_number": chunk.get("page_number"),
                     "token_count": chunk.get("token_count"),
                     "word_count": chunk.get("word_count"),
-                    "char_count": chunk.get("char_count")
+                    "char_count": chunk.get("char_count"),
+                    "page_end": chunk.get("page_end"),
+                    "char_start": chunk.get("char_start"),
+                    "char_end": chunk.get("char_end")
                 },
                 "timestamp": datetime.utcnow().isoformat()
             })
 
         return final_data
+
+
+# -------------------------
+# Process-wide Shared Generator
+# -------------------------
+_generators = {}
+_generators_lock = threading.Lock()
+
+
+def get_embedding_generator(model_name=None, provider=None):
+    """
+    Return the EmbeddingGenerator shared by every caller in the process
+    for this model/provider pair (ingestion threads, search, /query).
+    Sharing it is what lets single-flight deduplicate across threads.
+    """
+    key = (
+        model_name or os.getenv("EMBEDDING_MODEL"),
+        (provider or os.getenv("EMBEDDING_PROVIDER", "")).lower()
+    )
+
+    with _generators_lock:
+        generator = _generators.get(key)
+        if generator is None:
+            generator = EmbeddingGenerator(model_name=model_name, provider=provider)
+            _generators[key] = generator
+        return generator
+
+
+def get_embedding_metrics():
+    """
+    Metrics snapshots of every shared generator in the process, keyed by model.
+    """
+    with _generators_lock:
+        generators = list(_generators.values())
+
+    return {generator.model_name: generator.metrics_snapshot() for generator in generators}
@@ -0,0 +1,153 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+
+
+# Disk budget for cached page text; least recently used documents are evicted first
+DEFAULT_MAX_MB = float(os.getenv("EXTRACTION_CACHE_MAX_MB", 512))
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file's content, read in 1 MB blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    On-disk cache of per-page text for extracted documents.
+
+    One JSON-lines file per key, one {"page", "text"} record per line, so
+    a cached document is streamed back page by page just like a fresh
+    extraction. Keys combine the document's content hash with the
+    extractor and cleaner versions, so any change to either misses.
+
+    Entries are written to a temporary file and renamed into place when
+    complete; an interrupted extraction never leaves a partial entry.
+    Reads refresh the file's mtime, and the oldest files are evicted once
+    the directory exceeds max_mb.
+    """
+
+    def __init__(self, directory="data/extraction_cache", max_mb=DEFAULT_MAX_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.jsonl")
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def iter_pages(self, key):
+        """
+        Iterator over cached (page_number, text) pairs in page order.
+        Raises KeyError right away when the key is not cached.
+        """
+        path = self._path(key)
+
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            raise KeyError(key)
+
+        # Mark as recently used for eviction
+        os.utime(path)
+        return self._read(f)
+
+    def _read(self, f):
+        with f:
+            for line in f:
+                record = json.loads(line)
+                yield record["page"], record["text"]
+
+    @contextmanager
+    def writer(self, key):
+        """
+        Context manager returning write(page_number, text). The entry only
+        becomes visible if the block exits without an exception.
+        """
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+        f = open(temp_path, "w", encoding="utf-8")
+
+        def write(page_number, text):
+            f.write(json.dumps({"page": page_number, "text": text}) + "\n")
+
+        try:
+            yield write
+            f.close()
+            os.replace(temp_path, path)
+        except BaseException:
+            f.close()
+            os.remove(temp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits max_mb.
+        """
+        with self._lock:
+            entries = []
+            total = 0
+
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".jsonl"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def stats(self):
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith(".jsonl")]
+
+        return {
+            "entries": len(entries),
+            "disk_bytes": sum(e.stat().st_size for e in entries),
+            "max_bytes": self.max_bytes
+        }
+
+
+# -------------------------
+# Process-wide Cache Registry
+# -------------------------
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_extraction_cache(directory="data/extraction_cache", max_mb=DEFAULT_MAX_MB):
+    """
+    Return the single ExtractionCache for a directory in this process.
+    """
+    key = os.path.abspath(directory)
+
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ExtractionCache(directory, max_mb=max_mb)
+            _caches[key] = cache
+        return cache
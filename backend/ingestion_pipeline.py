@@ -132,16 +132,58 @@
 
 
 import os
+import json
+import asyncio
 import logging
+import itertools
+from datetime import datetime
+from contextlib import contextmanager, closing
 
-from backend.pdf_processor import PDFProcessor
+from backend.pdf_processor import PDFProcessor, EXTRACTOR_VERSION
 from backend.text_cleaner import TextCleaner
+from backend.extraction_cache import get_extraction_cache
 from backend.text_chunker import TextChunker
-from backend.embeddings import EmbeddingGenerator
+from backend.embeddings import get_embedding_generator, close_async_sessions
 from backend.vector_db import VectorDatabase
 
 logger = logging.getLogger("DocumentIngestion")
 
+# Chunks embedded and stored together; pages are streamed, so this bounds memory per document
+INGEST_WINDOW_CHUNKS = int(os.getenv("INGEST_WINDOW_CHUNKS", 256))
+
+# "document": chunks flow across page breaks (fewer, fuller chunks); "page": each page alone
+CHUNK_SCOPE = os.getenv("CHUNK_SCOPE", "document")
+
+# Strip running headers/footers repeated across pages before chunking (0 disables)
+REMOVE_REPEATED_LINES = os.getenv("REMOVE_REPEATED_LINES", "1") != "0"
+
+# Leading pages whose edge lines decide what counts as a running header/footer
+REPEATED_LINE_SAMPLE_PAGES = int(os.getenv("REPEATED_LINE_SAMPLE_PAGES", 32))
+
+# Per-user, per-document progress markers (<dir>/<user>/<file>.json)
+PROGRESS_DIR = "data/ingest_progress"
+
+
+# -------------------------
+# Progress Markers
+# -------------------------
+def _progress_path(user, source_file):
+    return os.path.join(PROGRESS_DIR, user.replace(" ", "_"), f"{source_file}.json")
+
+
+def get_progress(user, source_file):
+    """
+    Progress marker of a user's document: pages_done (every page up to it
+    is stored and searchable), chunks_stored, status ("in_progress" or
+    "complete") and the content_hash it refers to. None if never ingested.
+    Only reads PROGRESS_DIR, so it is cheap to call from the API.
+    """
+    try:
+        with open(_progress_path(user, source_file), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
 
 class DocumentIngestion:
     """
@@ -153,8 +195,11 @@ class DocumentIngestion:
         os.makedirs("logs", exist_ok=True)
         self.user = user
         self.cleaner = TextCleaner()
-        self.chunker = TextChunker()
-        self.embedder = EmbeddingGenerator()
+        # Chunk IDs hash the user, file, page span and text (idempotent re-ingestion)
+        self.chunker = TextChunker(id_namespace=user)
+        self.embedder = get_embedding_generator()
+        # Cleaned page text of already-ingested files, keyed by content hash
+        self.extraction_cache = get_extraction_cache()
 
         # 🔥 User-specific collection (MUST match SearchEngine)
         collection_name = f"user_{user.replace(' ', '_')}"
@@ -162,90 +207,317 @@ class DocumentIngestion:
 
         logger.info(f"Initialized ingestion for user={self.user}")
 
-    def process_single_document(self, pdf_path: str):
-        source_file = os.path.basename(pdf_path)
-        logger.info(
-            f"Processing started for: {source_file} (User: {self.user})"
-        )
-
+    async def aembed_chunks(self, chunks):
+        """
+        Embed chunks with concurrent batched requests on the current event loop.
+        """
+        return await self.embedder.agenerate_batch_embeddings(chunks)
+
+    @contextmanager
+    def _embedding_loop(self):
+        """
+        Private event loop for one document (ingestion runs in worker
+        threads). Every window of the document is embedded on it, so the
+        pooled HTTP session and concurrency limit last for the whole file.
+        """
+        runner = asyncio.Runner()
         try:
-            # 1️⃣ Extract text
-            processor = PDFProcessor(pdf_path)
-            extracted_data = processor.extract_text_pymupdf()
-
-            pages = extracted_data.get("text_by_page", {})
-            logger.info(f"Pages extracted: {len(pages)}")
-
-            # 2️⃣ Clean text
-            cleaned_pages = {
-                pg: self.cleaner.clean_text(txt)
-                for pg, txt in pages.items()
-                if txt and txt.strip()
-            }
+            yield runner
+        finally:
+            try:
+                runner.run(close_async_sessions())
+            finally:
+                runner.close()
+
+    def _embed_chunks(self, chunks, runner=None):
+        """
+        Run aembed_chunks on the document's event loop (see _embedding_loop),
+        or on a throwaway loop when none is given.
+        """
+        if runner is not None:
+            return runner.run(self.aembed_chunks(chunks))
+
+        with self._embedding_loop() as runner:
+            return runner.run(self.aembed_chunks(chunks))
+
+    def _iter_clean_pages(self, processor):
+        """
+        Yield (page_number, cleaned_text) for a PDF. An unchanged file
+        (same content hash, extractor and cleaner versions) is served from
+        the extraction cache without opening the PDF; otherwise pages are
+        extracted, cleaned and written to the cache as they stream by (a
+        stream closed early, e.g. after a slice, is not cached). Pages are
+        cleaned as they arrive (see TextCleaner.iter_clean_pages).
+        """
+        key = f"{processor.content_hash()}-hybrid-{EXTRACTOR_VERSION}-clean{self.cleaner.VERSION}"
 
-            # 3️⃣ Chunk text
-            all_chunks = []
-            for page_number, cleaned_text in cleaned_pages.items():
-                chunks = self.chunker.create_chunks(
-                    text=cleaned_text,
+        try:
+            pages = self.extraction_cache.iter_pages(key)
+        except KeyError:
+            pages = None
+
+        if pages is not None:
+            logger.info(f"Extraction cache hit for {processor.file_name}")
+            yield from pages
+            return
+
+        pages = self.cleaner.iter_clean_pages(processor.iter_pages(method="hybrid"))
+
+        with self.extraction_cache.writer(key) as write:
+            for page_number, cleaned_text in pages:
+                write(page_number, cleaned_text)
+                yield page_number, cleaned_text
+
+    def _strip_repeated_lines(self, processor, pages):
+        """
+        Yield (page_number, text) pairs with running headers/footers removed.
+
+        Fingerprints come from the document's first REPEATED_LINE_SAMPLE_PAGES
+        pages, buffered from the stream (every run streams from page 1), so
+        at most the sample is held back before the first chunk and the
+        document is never asked for its page count.
+        """
+        if not REMOVE_REPEATED_LINES:
+            yield from pages
+            return
+
+        pages = iter(pages)
+        buffered = list(itertools.islice(pages, REPEATED_LINE_SAMPLE_PAGES))
+        fingerprints = self.cleaner.find_repeated_lines([text for _, text in buffered])
+
+        if fingerprints:
+            logger.info(f"Removing {len(fingerprints)} repeated header/footer lines from {processor.file_name}")
+
+        for page_number, text in itertools.chain(buffered, pages):
+            yield page_number, self.cleaner.remove_repeated_lines(text, fingerprints)
+
+    def _iter_chunks(self, pages, source_file):
+        """
+        Chunk (page_number, text) pairs in CHUNK_SCOPE mode, yielding
+        chunks in document order.
+        """
+        if CHUNK_SCOPE == "page":
+            for page_number, text in pages:
+                yield from self.chunker.create_chunks(
+                    text=text,
                     source_file=source_file,
                     page_number=page_number,
                     strategy="sentences"  # change to "paragraphs" if needed
                 )
-                all_chunks.extend(chunks)
+            return
+
+        yield from self.chunker.chunk_document(pages, source_file)
+
+    # -------------------------
+    # Progress Markers
+    # -------------------------
+    def get_progress(self, source_file):
+        return get_progress(self.user, source_file)
+
+    def _save_progress(self, source_file, progress):
+        path = _progress_path(self.user, source_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        progress["updated"] = datetime.utcnow().isoformat()
+
+        # Write-then-rename so readers never see a half-written marker
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(progress, f, indent=2)
+        os.replace(temp_path, path)
+
+    def _start_progress(self, source_file, content_hash, page_range, resume):
+        """
+        Load or reset the marker. A full run counts the document's stored
+        chunks from zero again; resuming an interrupted run of the same
+        content keeps its pages_done, so the marker never moves back.
+        A changed file starts over.
+        """
+        progress = self.get_progress(source_file)
+
+        if not progress or progress.get("content_hash") != content_hash:
+            progress = {
+                "file_name": source_file,
+                "content_hash": content_hash,
+                "pages_done": 0,
+                "chunks_stored": 0,
+                "total_pages": None,
+                "status": "in_progress"
+            }
 
-            logger.info(f"Total chunks created: {len(all_chunks)}")
+        if page_range is None:
+            if resume and progress["status"] == "in_progress" and progress["pages_done"]:
+                logger.info(f"Resuming {source_file}: chunks up to page {progress['pages_done']} are already stored")
+            else:
+                progress["pages_done"] = 0
+            progress.update(chunks_stored=0, status="in_progress")
+
+        return progress
+
+    def _store_chunks(self, chunks, source_file, runner=None):
+        """
+        Embed one window of chunks and write it to the user's collection.
+        Chunk IDs are content hashes: duplicates within the window are
+        dropped and chunks already in the collection are skipped before
+        embedding, so re-ingesting an unchanged file makes no API calls.
+        Returns (chunks already stored, chunks newly stored).
+        """
+        unique = list({chunk["chunk_id"]: chunk for chunk in chunks}.values())
+        existing = self.vector_db.get_existing_ids([chunk["chunk_id"] for chunk in unique])
+        new_chunks = [chunk for chunk in unique if chunk["chunk_id"] not in existing]
+
+        if existing:
+            logger.info(f"Skipping {len(existing)} chunks already stored for {source_file}")
+
+        if not new_chunks:
+            return len(existing), 0
+
+        embedded_chunks = self._embed_chunks(new_chunks, runner)
+        embedding_data = self.embedder.prepare_embedding_data(embedded_chunks)
+
+        if not embedding_data:
+            return len(existing), 0
+
+        ids, embeddings, documents, metadatas = [], [], [], []
+
+        for item in embedding_data:
+            m = item["metadata"]
+            ids.append(m["chunk_id"])
+            embeddings.append(item["embedding_vector"])
+            documents.append(item["text"])
+            metadata = {
+                "source_file": source_file,
+                "page_number": m.get("page_number"),
+                "chunk_id": m.get("chunk_id"),
+                "user": self.user
+            }
+            # Page span of document-scope chunks (citations)
+            for key in ("page_end", "char_start", "char_end"):
+                if m.get(key) is not None:
+                    metadata[key] = m[key]
+            metadatas.append(metadata)
 
-            if not all_chunks:
+        logger.info(
+            f"Storing {len(ids)} vectors into collection user_{self.user}"
+        )
+
+        self.vector_db.add_documents(
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas
+        )
+
+        return len(existing), len(ids)
+
+    def process_single_document(self, pdf_path: str, data=None, page_range=None, resume=True):
+        """
+        Ingest one PDF. With data (the file's bytes, e.g. an upload still in
+        memory) the PDF is read from that buffer and pdf_path only names it.
+
+        page_range=(first, last), 1-based and inclusive (last=None: to the
+        end), ingests a slice: the document is still chunked from page 1
+        (chunk boundaries, and so chunk IDs, depend on the text before
+        them), but only chunks overlapping the slice are stored. Each stored
+        window advances the document's progress marker (see get_progress),
+        so early pages are searchable while later ones are still being
+        indexed. Re-running an interrupted file skips the chunks it already
+        stored (resume=False also resets its pages_done).
+        """
+        source_file = os.path.basename(pdf_path)
+        logger.info(
+            f"Processing started for: {source_file} (User: {self.user})"
+        )
+
+        try:
+            # 1️⃣ + 2️⃣ Extract and clean text page by page (cached per file content)
+            if data is not None:
+                processor = PDFProcessor(data, file_name=source_file)
+            else:
+                processor = PDFProcessor(pdf_path)
+
+            progress = self._start_progress(
+                source_file, processor.content_hash(), page_range, resume
+            )
+            first, last = page_range or (1, None)
+            if first < 1 or (last is not None and first > last):
+                raise ValueError(f"Invalid page range: {page_range}")
+            # Only a slice that continues the stored prefix can advance pages_done
+            contiguous = first <= progress["pages_done"] + 1
+
+            page_total = 0
+            chunk_total = 0
+            window = []
+
+            def flush(page_number):
+                existing, stored = self._store_chunks(window, source_file, runner) if window else (0, 0)
+                # A full run recounts every chunk of the file; a slice adds what it stored
+                progress["chunks_stored"] += stored if page_range else existing + stored
+                if contiguous:
+                    progress["pages_done"] = max(progress["pages_done"], page_number)
+                self._save_progress(source_file, progress)
+
+            # One open document (xref, fonts) and one event loop (pooled HTTP
+            # session) serve the whole file
+            with processor, self._embedding_loop() as runner:
+                page_number = 0
+
+                def pages():
+                    nonlocal page_number, page_total
+                    for page_number, cleaned_text in self._iter_clean_pages(processor):
+                        page_total += 1
+                        yield page_number, cleaned_text
+
+                # 3️⃣ Chunk text from page 1; pages past a slice are only
+                # read until its last chunk is complete
+                pages_stripped = self._strip_repeated_lines(processor, pages())
+                with closing(self._iter_chunks(pages_stripped, source_file)) as chunks:
+                    for chunk in chunks:
+                        if chunk.get("page_end", chunk["page_number"]) < first:
+                            continue
+                        if last is not None and chunk["page_number"] > last:
+                            break
+
+                        window.append(chunk)
+                        chunk_total += 1
+
+                        # 4️⃣ Embed + store each full window, so memory stays bounded.
+                        # The last chunk's end page may continue in the next chunk.
+                        if len(window) >= INGEST_WINDOW_CHUNKS:
+                            flush(chunk.get("page_end", chunk["page_number"]) - 1)
+                            window = []
+                    else:
+                        # The document ran out inside the range
+                        progress["total_pages"] = max(page_number, progress["pages_done"])
+                        if contiguous:
+                            progress["status"] = "complete"
+
+                flush(page_number if last is None else min(page_number, last))
+
+            logger.info(f"Pages extracted: {page_total}")
+            logger.info(f"Total chunks created: {chunk_total}")
+
+            if not chunk_total and not progress["chunks_stored"]:
                 logger.warning(
                     f"No chunks generated for {source_file} (User: {self.user})"
                 )
                 return {"file_name": source_file, "status": "NO_CHUNKS"}
 
-            # 4️⃣ Generate embeddings
-            embedded_chunks = self.embedder.generate_batch_embeddings(all_chunks)
-            embedding_data = self.embedder.prepare_embedding_data(embedded_chunks)
-
-            logger.info(f"Embedding items prepared: {len(embedding_data)}")
-
-            if not embedding_data:
+            if not progress["chunks_stored"]:
                 logger.warning(
                     f"No embeddings generated for {source_file} (User: {self.user})"
                 )
                 return {"file_name": source_file, "status": "NO_EMBEDDINGS"}
 
-            # 5️⃣ Prepare DB payload
-            ids, embeddings, documents, metadatas = [], [], [], []
-
-            for item in embedding_data:
-                m = item["metadata"]
-                ids.append(m["chunk_id"])
-                embeddings.append(item["embedding_vector"])
-                documents.append(item["text"])
-                metadatas.append({
-                    "source_file": source_file,
-                    "page_number": m.get("page_number"),
-                    "chunk_id": m.get("chunk_id"),
-                    "user": self.user
-                })
-
-            logger.info(
-                f"Storing {len(ids)} vectors into collection user_{self.user}"
-            )
-
-            # 6️⃣ Store in ChromaDB
-            self.vector_db.add_documents(
-                ids=ids,
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas
-            )
-
             logger.info(
                 f"Ingestion SUCCESS for {source_file} (User: {self.user})"
             )
 
-            return {"file_name": source_file, "status": "SUCCESS"}
+            return {
+                "file_name": source_file,
+                "status": "SUCCESS",
+                "pages_done": progress["pages_done"]
+            }
 
         except Exception as e:
             logger.exception(
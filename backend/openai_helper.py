@@ -64,10 +64,14 @@ import os
 import openai
 from dotenv import load_dotenv
 
+from backend.rate_limiter import get_rate_limiter
 from utils.error_handler import APIError, logger
 
 load_dotenv()
 
+# Tokens reserved for the model's reply when budgeting a chat request
+COMPLETION_TOKEN_ALLOWANCE = 500
+
 
 class OpenAIHelper:
     def __init__(self):
@@ -76,6 +80,15 @@ class OpenAIHelper:
             raise APIError("OpenAI API key not configured")
 
         openai.api_key = api_key
+        # Shared with every other chat caller in the process
+        self.rate_limiter = get_rate_limiter("chat")
+
+    def _estimate_tokens(self, messages):
+        """
+        Rough prompt size (~4 characters per token) plus room for the reply.
+        """
+        prompt_chars = sum(len(m.get("content") or "") for m in messages)
+        return prompt_chars // 4 + COMPLETION_TOKEN_ALLOWANCE
 
     def get_completion(
         self,
@@ -84,6 +97,8 @@ class OpenAIHelper:
         temperature=0.2,
         timeout=30
     ):
+        self.rate_limiter.acquire(tokens=self._estimate_tokens(messages))
+
         try:
             response = openai.ChatCompletion.create(
                 model=model,
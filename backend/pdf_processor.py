@@ -1,68 +1,376 @@
 import fitz  # PyMuPDF
 import pdfplumber
+import io
 import os
+import re
+import hashlib
+import collections
+import concurrent.futures
+from contextlib import contextmanager
+
+from backend.extraction_cache import file_digest
+from backend.process_pool import get_process_pool
+
+
+# Worker processes used to extract one document's pages in parallel (1 = serial)
+EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", os.cpu_count() or 1))
+
+# Below this many pages per worker, process start-up and IPC cost more than they save
+MIN_PAGES_PER_WORKER = 16
+
+# Bump when extraction output changes, so cached page text is not reused
+EXTRACTOR_VERSION = f"2-pymupdf{fitz.VersionBind}-pdfplumber{pdfplumber.__version__}"
+
+# Hybrid extraction: a PyMuPDF page is re-extracted with pdfplumber when it
+# yields fewer characters than this per square inch of page...
+LOW_YIELD_CHARS_PER_SQ_INCH = 1.0
+# ...or when more than this share of its characters are unprintable
+MAX_GARBLED_RATIO = 0.1
+
+# Low-yield pages sent to a worker together (pdfplumber walks the whole page
+# tree on every open, so documents are opened once per worker, not per page)
+FALLBACK_BATCH_PAGES = 16
+
+# Once this many pages are seen and nearly all of them are low-yield, the
+# document has no text layer for pdfplumber to find; the fallback is skipped
+FALLBACK_PROBE_PAGES = 16
+NO_TEXT_LAYER_RATIO = 0.9
+
+# Control characters, private-use glyphs and U+FFFD: signs of a broken font mapping
+_GARBLED_PATTERN = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\ue000-\uf8ff\ufffd]")
+
+
+# In-memory sources (upload buffers) accepted by PDFProcessor besides file paths
+BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+
+def _open_fitz(source):
+    if isinstance(source, BUFFER_TYPES):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def _open_pdfplumber(source, **kwargs):
+    if isinstance(source, BUFFER_TYPES):
+        return pdfplumber.open(io.BytesIO(source), **kwargs)
+    return pdfplumber.open(source, **kwargs)
+
+
+# -------------------------
+# Process-Pool Extraction
+# -------------------------
+def _page_record(doc, page_num):
+    """
+    (page_number, text, area in square inches) for a 0-based page index.
+    """
+    page = doc.load_page(page_num)
+    area = page.rect.width * page.rect.height / (72 * 72)
+    return page_num + 1, page.get_text().strip(), area
+
+
+def _extract_page_range(file_path, start, end):
+    """
+    Worker: open the document in this process and extract pages [start, end).
+    Returns (page_number, text, area) records with 1-based page numbers.
+    """
+    doc = _open_fitz(file_path)
+    try:
+        return [_page_record(doc, page_num) for page_num in range(start, end)]
+    finally:
+        doc.close()
+
+
+def _pdfplumber_texts(pages):
+    """
+    {page_number: text} for pdfplumber pages; unreadable pages are left out.
+    """
+    texts = {}
+    for page in pages:
+        try:
+            text = page.extract_text()
+            texts[page.page_number] = text.strip() if text else ""
+        except Exception:
+            pass
+        finally:
+            # Drop the page's parsed objects once it has been read
+            page.close()
+    return texts
+
+
+# Worker's open pdfplumber document, ((path, mtime, size), pdf): every batch
+# of one file reuses it, so each worker walks the page tree once per file
+_worker_plumber = None
+
+
+def _extract_pdfplumber_pages(file_path, page_numbers):
+    """
+    Worker: re-extract several pages (1-based) with pdfplumber.
+    """
+    global _worker_plumber
+
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+
+    if _worker_plumber is None or _worker_plumber[0] != key:
+        if _worker_plumber is not None:
+            _worker_plumber[1].close()
+            _worker_plumber = None
+        _worker_plumber = (key, pdfplumber.open(file_path))
+
+    pages = _worker_plumber[1].pages
+    return _pdfplumber_texts([pages[page_number - 1] for page_number in page_numbers])
+
+
+class _FallbackBatch:
+    """
+    Low-yield pages sent to pdfplumber together; future is set on submit
+    and resolves to {page_number: text}.
+    """
+
+    def __init__(self):
+        self.page_numbers = []
+        self.future = None
+
+
+def _garbled_count(text):
+    return len(_GARBLED_PATTERN.findall(text))
+
+
+def is_low_yield(text, area):
+    """
+    Cheap check for pages PyMuPDF decoded badly: too little text for the
+    page size, or too many unprintable characters.
+    """
+    if len(text) < LOW_YIELD_CHARS_PER_SQ_INCH * area:
+        return True
+    return _garbled_count(text) > MAX_GARBLED_RATIO * len(text)
+
+
+def _has_text_layer(pages_seen, low_yield_pages):
+    """
+    False once nearly every page seen is low-yield (scanned or image-only
+    document): pdfplumber reads the same missing text layer.
+    """
+    if pages_seen < FALLBACK_PROBE_PAGES:
+        return True
+    return low_yield_pages < NO_TEXT_LAYER_RATIO * pages_seen
+
+
+def _better_text(original, fallback):
+    """
+    Keep whichever extraction has more printable characters.
+    """
+    if len(fallback) - _garbled_count(fallback) > len(original) - _garbled_count(original):
+        return fallback
+    return original
+
+
+def _page_ranges(first, end, workers):
+    """
+    Contiguous ranges covering pages [first, end) (0-based), a few per
+    worker so uneven pages balance out.
+    """
+    page_count = end - first
+    ranges_count = min(workers * 4, max(1, page_count // MIN_PAGES_PER_WORKER))
+    step = -(-page_count // ranges_count)
+    return [(start, min(start + step, end)) for start in range(first, end, step)]
+
+
+def _resolve_page_range(page_range, page_count):
+    """
+    Turn a 1-based inclusive (first, last) range into 0-based [start, end).
+    last may be None (to the end); None selects the whole document.
+    """
+    if page_range is None:
+        return 0, page_count
+
+    first, last = page_range
+
+    if first < 1 or (last is not None and first > last):
+        raise ValueError(f"Invalid page range: {page_range}")
+
+    # A range past the last page is empty rather than an error (e.g. resuming a finished file)
+    end = page_count if last is None else min(last, page_count)
+    return min(first - 1, end), end
 
 
 class PDFProcessor:
-    def __init__(self, file_path: str):
-        self.file_path = file_path
-        self.file_name = os.path.basename(file_path)
+    """
+    Extracts text and metadata from a PDF given as a file path or as an
+    in-memory buffer (bytes, bytearray or memoryview, e.g. an upload), so
+    an upload can be hashed, validated and extracted without a disk round trip.
 
-    def get_pdf_metadata(self):
+    Used as a context manager it is a session: the document is opened on
+    first use and kept open until exit, so metadata, page access and serial
+    extraction share one parse (xref, fonts). Without a session each call
+    opens and closes the document itself.
+
+        with PDFProcessor(path) as pdf:
+            title = pdf.metadata["title"]
+            first_page = pdf.get_page_text(1)
+            for page_number, text in pdf.iter_pages():
+                ...
+    """
+
+    def __init__(self, source, workers: int = None, file_name: str = None):
+        self.source = source
+
+        if isinstance(source, BUFFER_TYPES):
+            self.file_path = None
+            self.file_name = file_name or "document.pdf"
+        else:
+            self.file_path = source
+            self.file_name = file_name or os.path.basename(source)
+
+        self.workers = workers or EXTRACTION_WORKERS
+        self._content_hash = None
+
+        self._in_session = False
+        self._doc = None
+        self._metadata = None
+
+    # -------------------------
+    # Session
+    # -------------------------
+    def __enter__(self):
+        # Opening is deferred, so a session that never touches the PDF costs nothing
+        self._in_session = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._in_session = False
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+
+    def _open_document(self):
+        doc = _open_fitz(self.source)
+
+        if doc.needs_pass:
+            doc.close()
+            raise RuntimeError("Password-protected PDF")
+
+        return doc
+
+    @contextmanager
+    def _document(self):
         """
-        Extract metadata: file name, total pages, title, author
+        The session's open document, or a temporary one outside a session.
         """
+        if self._in_session:
+            if self._doc is None:
+                self._doc = self._open_document()
+            yield self._doc
+            return
+
+        doc = self._open_document()
         try:
-            doc = fitz.open(self.file_path)
+            yield doc
+        finally:
+            doc.close()
 
-            if doc.needs_pass:
-                raise RuntimeError("Password-protected PDF")
+    @property
+    def page_count(self):
+        with self._document() as doc:
+            return doc.page_count
 
-            page_count = doc.page_count
-            metadata = doc.metadata
+    @property
+    def metadata(self):
+        """
+        File name, total pages, title and author (read once per session).
+        """
+        if self._metadata is not None:
+            return self._metadata
 
+        with self._document() as doc:
+            metadata = doc.metadata
             result = {
                 "file_name": self.file_name,
-                "total_pages": page_count,
+                "total_pages": doc.page_count,
                 "title": metadata.get("title"),
                 "author": metadata.get("author")
             }
 
-            doc.close()
-            return result
+        if self._in_session:
+            self._metadata = result
+        return result
 
-        except Exception as e:
-            raise RuntimeError(f"Metadata extraction failed: {str(e)}")
+    def get_page_text(self, page_number: int):
+        """
+        Text of a single page (1-based), decoded on demand.
+        """
+        with self._document() as doc:
+            if not 1 <= page_number <= doc.page_count:
+                raise IndexError(f"Page {page_number} out of range (1-{doc.page_count})")
+            return doc.load_page(page_number - 1).get_text().strip()
+
+    def _resolve_workers(self, workers):
+        # Worker processes would each need a pickled copy of an in-memory buffer
+        if self.file_path is None:
+            return 1
+        return workers or self.workers
 
-    def extract_text_pymupdf(self):
+    def content_hash(self):
         """
-        Primary extraction method using PyMuPDF
+        SHA-256 of the PDF's bytes (computed once per processor).
+        """
+        if self._content_hash is None:
+            if self.file_path is None:
+                self._content_hash = hashlib.sha256(self.source).hexdigest()
+            else:
+                self._content_hash = file_digest(self.file_path)
+        return self._content_hash
+
+    def get_pdf_metadata(self):
+        """
+        Extract metadata: file name, total pages, title, author
         """
         try:
-            text_by_page = {}
+            return self.metadata
+
+        except Exception as e:
+            raise RuntimeError(f"Metadata extraction failed: {str(e)}")
 
-            doc = fitz.open(self.file_path)
+    # -------------------------
+    # Streaming Extraction
+    # -------------------------
+    def iter_pages_pymupdf(self, workers: int = None, page_range=None):
+        """
+        Yield (page_number, text) in page order as pages are decoded.
+        Only the pages in flight are held in memory. Large documents are
+        extracted by a process pool (workers, default PDF_EXTRACTION_WORKERS);
+        workers=1 is serial. page_range=(first, last), 1-based and inclusive
+        (last=None: to the end), restricts extraction to a slice.
+        """
+        for page_number, text, _ in self._iter_pymupdf_records(workers, page_range):
+            yield page_number, text
 
-            if doc.needs_pass:
-                raise RuntimeError("Password-protected PDF")
+    def _iter_pymupdf_records(self, workers=None, page_range=None):
+        """
+        Yield (page_number, text, area) records; see iter_pages_pymupdf().
+        """
+        try:
+            workers = self._resolve_workers(workers)
 
-            page_count = doc.page_count
+            with self._document() as doc:
+                page_count = doc.page_count
 
-            if page_count == 0:
-                raise ValueError("Empty PDF document")
+                if page_count == 0:
+                    raise ValueError("Empty PDF document")
 
-            for page_num in range(page_count):
-                page = doc.load_page(page_num)
-                text = page.get_text().strip()
-                text_by_page[page_num + 1] = text
+                start, end = _resolve_page_range(page_range, page_count)
+                parallel = workers > 1 and end - start >= 2 * MIN_PAGES_PER_WORKER
 
-            doc.close()
+                if not parallel:
+                    for page_num in range(start, end):
+                        yield _page_record(doc, page_num)
 
-            return {
-                "file_name": self.file_name,
-                "total_pages": page_count,
-                "text_by_page": text_by_page
-            }
+            # Worker processes open their own copies; the session's document stays open
+            if parallel:
+                yield from self._iter_parallel(start, end, workers)
 
         except fitz.FileDataError:
             raise RuntimeError("Corrupted or invalid PDF file")
@@ -70,28 +378,176 @@ class PDFProcessor:
         except Exception as e:
             raise RuntimeError(f"PyMuPDF extraction failed: {str(e)}")
 
-    def extract_text_pdfplumber(self):
+    def _iter_parallel(self, start, end, workers):
         """
-        Fallback extraction method using pdfplumber
+        Fan page ranges out to worker processes (each opens its own fitz
+        document) and yield their pages back in page order. At most
+        2 * workers ranges are outstanding at a time.
         """
+        pool = get_process_pool(workers)
+        ranges = iter(_page_ranges(start, end, workers))
+        pending = []
+
         try:
-            text_by_page = {}
+            for range_start, range_end in ranges:
+                pending.append(pool.submit(_extract_page_range, self.file_path, range_start, range_end))
+                if len(pending) >= 2 * workers:
+                    yield from pending.pop(0).result()
 
-            with pdfplumber.open(self.file_path) as pdf:
-                page_count = len(pdf.pages)
+            while pending:
+                yield from pending.pop(0).result()
+        finally:
+            for future in pending:
+                future.cancel()
 
-                if page_count == 0:
+    def iter_pages_pdfplumber(self, page_range=None):
+        """
+        Yield (page_number, text) in page order using pdfplumber.
+        """
+        try:
+            with _open_pdfplumber(self.source) as pdf:
+                if len(pdf.pages) == 0:
                     raise ValueError("Empty PDF document")
 
-                for i, page in enumerate(pdf.pages):
-                    text = page.extract_text()
-                    text_by_page[i + 1] = text.strip() if text else ""
+                start, end = _resolve_page_range(page_range, len(pdf.pages))
 
-            return {
-                "file_name": self.file_name,
-                "total_pages": page_count,
-                "text_by_page": text_by_page
-            }
+                for i in range(start, end):
+                    page = pdf.pages[i]
+                    text = page.extract_text()
+                    yield i + 1, text.strip() if text else ""
+                    # Drop the page's parsed objects once it has been consumed
+                    page.close()
 
         except Exception as e:
             raise RuntimeError(f"pdfplumber extraction failed: {str(e)}")
+
+    def iter_pages_hybrid(self, workers: int = None, page_range=None):
+        """
+        PyMuPDF first; pages it decodes badly (see is_low_yield) are
+        re-extracted with pdfplumber and the better text wins. In the pool
+        low-yield pages go out FALLBACK_BATCH_PAGES at a time and each
+        worker keeps the file open; serial runs share a single open.
+        Pages are still yielded in page order.
+        """
+        workers = self._resolve_workers(workers)
+        pool = get_process_pool(workers) if workers > 1 else None
+        # (page_number, text, fallback batch or None), in page order
+        pending = collections.deque()
+        batch = None
+        plumber = None
+        pages_seen = low_yield_pages = 0
+
+        def submit():
+            nonlocal batch
+            batch.future = pool.submit(_extract_pdfplumber_pages, self.file_path, batch.page_numbers)
+            batch = None
+
+        def extract_serial(page_number):
+            nonlocal plumber
+            done = _FallbackBatch()
+            done.future = concurrent.futures.Future()
+            try:
+                if plumber is None:
+                    plumber = _open_pdfplumber(self.source)
+                done.future.set_result(_pdfplumber_texts([plumber.pages[page_number - 1]]))
+            except Exception as e:
+                done.future.set_exception(e)
+            return done
+
+        def resolve(record):
+            page_number, text, fallback = record
+            if fallback is None:
+                return page_number, text
+            try:
+                fallback_text = fallback.future.result().get(page_number)
+            except Exception:
+                fallback_text = None
+            if fallback_text is None:
+                # pdfplumber could not read the page either; keep what PyMuPDF found
+                return page_number, text
+            return page_number, _better_text(text, fallback_text)
+
+        def ready(record):
+            fallback = record[2]
+            return fallback is None or (fallback.future is not None and fallback.future.done())
+
+        try:
+            for page_number, text, area in self._iter_pymupdf_records(workers, page_range):
+                fallback = None
+                pages_seen += 1
+
+                low_yield = is_low_yield(text, area)
+                low_yield_pages += low_yield
+
+                if low_yield and _has_text_layer(pages_seen, low_yield_pages):
+                    if pool is None:
+                        fallback = extract_serial(page_number)
+                    else:
+                        batch = batch or _FallbackBatch()
+                        batch.page_numbers.append(page_number)
+                        fallback = batch
+
+                pending.append((page_number, text, fallback))
+
+                if batch is not None and (
+                    len(batch.page_numbers) >= FALLBACK_BATCH_PAGES or len(pending) > 4 * workers
+                ):
+                    submit()
+
+                # Yield everything that no longer waits on a re-extraction
+                while pending and (ready(pending[0]) or len(pending) > 4 * workers):
+                    yield resolve(pending.popleft())
+
+            if batch is not None:
+                submit()
+
+            while pending:
+                yield resolve(pending.popleft())
+        finally:
+            for _, _, fallback in pending:
+                if fallback is not None and fallback.future is not None:
+                    fallback.future.cancel()
+            if plumber is not None:
+                plumber.close()
+
+    def iter_pages(self, method: str = "pymupdf", workers: int = None, page_range=None):
+        """
+        Page generator for the chosen extractor ("pymupdf", "pdfplumber" or "hybrid").
+        """
+        if method == "pymupdf":
+            return self.iter_pages_pymupdf(workers=workers, page_range=page_range)
+        if method == "pdfplumber":
+            return self.iter_pages_pdfplumber(page_range=page_range)
+        if method == "hybrid":
+            return self.iter_pages_hybrid(workers=workers, page_range=page_range)
+        raise ValueError(f"Unknown extraction method: {method}")
+
+    # -------------------------
+    # Whole-Document Extraction
+    # -------------------------
+    def _collect(self, pages):
+        text_by_page = dict(pages)
+
+        return {
+            "file_name": self.file_name,
+            "total_pages": len(text_by_page),
+            "text_by_page": text_by_page
+        }
+
+    def extract_text_pymupdf(self, workers: int = None):
+        """
+        Primary extraction method using PyMuPDF
+        """
+        return self._collect(self.iter_pages_pymupdf(workers=workers))
+
+    def extract_text_pdfplumber(self):
+        """
+        Fallback extraction method using pdfplumber
+        """
+        return self._collect(self.iter_pages_pdfplumber())
+
+    def extract_text_hybrid(self, workers: int = None):
+        """
+        PyMuPDF with per-page pdfplumber fallback for low-yield pages
+        """
+        return self._collect(self.iter_pages_hybrid(workers=workers))
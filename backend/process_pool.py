@@ -0,0 +1,22 @@
+import threading
+import concurrent.futures
+
+
+# -------------------------
+# Process-wide Pool Registry
+# -------------------------
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_process_pool(workers):
+    """
+    Return the process pool shared by PDF extraction and text cleaning for
+    a worker count, so concurrent ingestion threads do not each spawn workers.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            _pools[workers] = pool
+        return pool
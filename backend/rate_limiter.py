@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import threading
+
+
+class TokenBucketRateLimiter:
+    """
+    Thread-safe token-bucket limiter that budgets both requests per minute
+    and tokens per minute.
+
+    Each acquire() reserves capacity immediately and then waits out any
+    deficit, so concurrent callers (threads or asyncio tasks) queue up in
+    order instead of polling and bursting together.
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=1000000):
+        if requests_per_minute <= 0 or tokens_per_minute <= 0:
+            raise ValueError("Rate limits must be positive")
+
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # -------------------------
+    # Bucket Accounting
+    # -------------------------
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + elapsed * self.requests_per_minute / 60
+        )
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    def _reserve(self, tokens):
+        """
+        Take one request and `tokens` tokens from the buckets.
+        Returns how long the caller must wait before sending.
+        """
+        # A single call larger than the whole minute budget still goes through once the bucket is full
+        tokens = min(max(tokens, 0), self.tokens_per_minute)
+
+        with self._lock:
+            self._refill(time.monotonic())
+
+            self._requests -= 1
+            self._tokens -= tokens
+
+            request_wait = max(0.0, -self._requests) * 60 / self.requests_per_minute
+            token_wait = max(0.0, -self._tokens) * 60 / self.tokens_per_minute
+
+            return max(request_wait, token_wait)
+
+    # -------------------------
+    # Public API
+    # -------------------------
+    def acquire(self, tokens=1):
+        """
+        Block until one request with `tokens` tokens fits the budget.
+        Returns the number of seconds spent waiting.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """
+        asyncio variant of acquire(); sleeps without blocking the event loop.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def headroom(self):
+        """
+        Capacity available right now without waiting.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+
+            return {
+                "requests": max(0, int(self._requests)),
+                "tokens": max(0, int(self._tokens)),
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute
+            }
+
+
+# -------------------------
+# Process-wide Limiters
+# -------------------------
+# name -> (requests/min env var, default, tokens/min env var, default)
+LIMIT_DEFAULTS = {
+    "embeddings": ("OPENAI_EMBEDDING_RPM", 60, "OPENAI_EMBEDDING_TPM", 1000000),
+    "chat": ("OPENAI_CHAT_RPM", 60, "OPENAI_CHAT_TPM", 90000),
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name):
+    """
+    Return the shared limiter for an API family ("embeddings" or "chat").
+    Every caller in the process draws from the same budget.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+
+        if limiter is None:
+            rpm_var, rpm_default, tpm_var, tpm_default = LIMIT_DEFAULTS[name]
+            limiter = TokenBucketRateLimiter(
+                requests_per_minute=int(os.getenv(rpm_var, rpm_default)),
+                tokens_per_minute=int(os.getenv(tpm_var, tpm_default))
+            )
+            _limiters[name] = limiter
+
+        return limiter
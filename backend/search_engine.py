@@ -85,9 +85,10 @@
 import math
 import json
 import os
+import asyncio
 import logging
 
-from backend.embeddings import EmbeddingGenerator
+from backend.embeddings import get_embedding_generator
 from backend.vector_db import VectorDatabase
 from utils.error_handler import EmbeddingError, DatabaseError
 
@@ -105,7 +106,7 @@ class SearchEngine:
 
     def __init__(self, user: str):
         self.user = user
-        self.embedder = EmbeddingGenerator()
+        self.embedder = get_embedding_generator()
 
         # 🔥 IMPORTANT: must match DocumentIngestion collection name
         collection_name = f"user_{user.replace(' ', '_')}"
@@ -137,6 +138,23 @@ class SearchEngine:
             logger.error(f"Embedding generation failed: {e}")
             raise EmbeddingError("Embedding failed")
 
+        return self._search_by_embedding(query, q_emb, k)
+
+    async def asearch_similar_chunks(self, query: str, k: int = 8):
+        """
+        Async variant of search_similar_chunks().
+        The query embedding is awaited on the event loop; only the local
+        ChromaDB lookup runs in a worker thread.
+        """
+        try:
+            q_emb = await self.embedder.agenerate_embedding(query)
+        except Exception as e:
+            logger.error(f"Embedding generation failed: {e}")
+            raise EmbeddingError("Embedding failed")
+
+        return await asyncio.to_thread(self._search_by_embedding, query, q_emb, k)
+
+    def _search_by_embedding(self, query: str, q_emb, k: int):
         # 2️⃣ Query ChromaDB (NO user filter needed)
         try:
             res = self.collection.query(
@@ -167,6 +185,7 @@ class SearchEngine:
                 "chunk_text": doc,
                 "source_file": meta.get("source_file", "Unknown"),
                 "page_number": meta.get("page_number", "?"),
+                "page_end": meta.get("page_end", meta.get("page_number", "?")),
                 "relevance_score": round(score, 4)
             })
 
@@ -1,7 +1,69 @@
-import uuid
 import math
 import re
-import tiktoken
+import bisect
+import hashlib
+import itertools
+
+from backend.tokenizer import get_encoder, encode_batch
+
+
+# Whitespace after sentence-ending punctuation; sentences split here
+_SENTENCE_BREAK_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+# Joins consecutive pages in document-scope chunking
+PAGE_SEPARATOR = "\n"
+
+# Pages tokenized together by chunk_document (one encode_batch call)
+ENCODE_BATCH_PAGES = 32
+
+
+def make_chunk_id(namespace, source_file, page_start, page_end, text):
+    """
+    Content-addressed chunk ID: SHA-256 of the namespace (the user), source
+    file, page span and chunk text. Re-chunking an unchanged document gives
+    the same IDs, so storing them again is an idempotent upsert.
+    """
+    key = "\x1f".join(str(part) for part in (namespace, source_file, page_start, page_end, text))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class _SpanPacker:
+    """
+    Greedy packing of sentences into token spans of at most max_tokens.
+    Fed sentence end indexes in order; each chunk holds whole sentences and
+    the next one starts overlap_tokens before its end (less if the next
+    sentence would not fit). A sentence longer than max_tokens is cut into
+    fixed windows.
+    """
+
+    def __init__(self, max_tokens, overlap_tokens):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.step = max(1, max_tokens - overlap_tokens)
+        # Current chunk: [start, end) holds whole sentences
+        self.start = 0
+        self.end = 0
+
+    def add(self, bound):
+        """
+        Add the sentence ending at token index bound; returns completed spans.
+        """
+        spans = []
+
+        if bound - self.start > self.max_tokens:
+            if self.end > self.start:
+                spans.append((self.start, self.end))
+                self.start = max(self.end - self.overlap_tokens, min(self.end, bound - self.max_tokens))
+
+            while bound - self.start > self.max_tokens:
+                spans.append((self.start, self.start + self.max_tokens))
+                self.start += self.step
+
+        self.end = bound
+        return spans
+
+    def finish(self):
+        return [(self.start, self.end)] if self.end > self.start else []
 
 
 class TextChunker:
@@ -11,8 +73,18 @@ class TextChunker:
     2. Sentence-based semantic chunking
     """
 
-    def __init__(self, model_name="gpt-3.5-turbo"):
-        self.encoder = tiktoken.encoding_for_model(model_name)
+    def __init__(self, model_name="gpt-3.5-turbo", id_namespace=""):
+        self.model_name = model_name
+        # Mixed into chunk IDs so equal chunks of different users never collide
+        self.id_namespace = id_namespace
+        self._encoder = None
+
+    @property
+    def encoder(self):
+        # Shared by every chunker in the process and loaded on first use
+        if self._encoder is None:
+            self._encoder = get_encoder(self.model_name)
+        return self._encoder
 
     # --------------------------------------------------
     # Utility Functions
@@ -20,11 +92,20 @@ class TextChunker:
     def count_tokens(self, text: str) -> int:
         return len(self.encoder.encode(text))
 
-    def calculate_optimal_chunk_size(self, text: str) -> int:
+    def encode_batch(self, texts, num_threads=None):
+        """
+        Tokenize many texts (e.g. pages) at once with tiktoken's threaded
+        encode_batch. Returns one token list per text, in order.
+        """
+        return encode_batch(texts, self.model_name, num_threads=num_threads)
+
+    def calculate_optimal_chunk_size(self, text: str, total_tokens=None) -> int:
         """
         Dynamically calculate chunk size based on document length
+        (total_tokens skips re-encoding when the caller already has it)
         """
-        total_tokens = self.count_tokens(text)
+        if total_tokens is None:
+            total_tokens = self.count_tokens(text)
 
         if total_tokens < 3000:
             return 500
@@ -33,22 +114,89 @@ class TextChunker:
         else:
             return 1000
 
+    def _token_offsets(self, text, tokens):
+        """
+        Character offset of each token in text, plus len(text) at the end.
+        """
+        if text.isascii():
+            # One byte per character: offsets are running token byte lengths
+            return [0, *itertools.accumulate(map(len, self.encoder.decode_tokens_bytes(tokens)))]
+
+        _, offsets = self.encoder.decode_with_offsets(tokens)
+        return offsets + [len(text)]
+
+    def _sentence_bounds(self, text, offsets):
+        """
+        Token index at which each sentence ends (the last is len(tokens)).
+        A break inside a token moves to the end of that token.
+        """
+        token_total = len(offsets) - 1
+        bounds = []
+
+        for match in _SENTENCE_BREAK_PATTERN.finditer(text):
+            bound = bisect.bisect_left(offsets, match.start(), 0, token_total)
+            if 0 < bound and (not bounds or bound > bounds[-1]):
+                bounds.append(bound)
+
+        if not bounds or bounds[-1] < token_total:
+            bounds.append(token_total)
+
+        return bounds
+
+    def _chunk_record(self, text, source_file, page_number, chunk_index, token_count, page_end=None):
+        page_end = page_number if page_end is None else page_end
+
+        return {
+            "chunk_id": make_chunk_id(self.id_namespace, source_file, page_number, page_end, text),
+            "chunk_index": chunk_index,
+            "text": text,
+            "source_file": source_file,
+            "page_number": page_number,
+            "token_count": token_count,
+            "char_count": len(text),
+            "word_count": len(text.split())
+        }
+
     def merge_small_chunks(self, chunks, min_tokens=200):
         """
-        Merge chunks that are too small with neighboring chunks
+        Merge chunks that are too small with neighboring chunks.
+        Returns chunk records renumbered from 0; a merged chunk keeps the
+        source_file and page_number of its first part.
+
+        The running size is the sum of the parts' token_count (each part is
+        counted once if missing), so merging is linear; each merged text is
+        encoded once for its exact token_count.
         """
         merged = []
-        buffer = ""
+        parts = []
+        buffer_tokens = 0
+
+        def emit():
+            text = " ".join(chunk["text"] for chunk in parts).strip()
+            if text:
+                first, last = parts[0], parts[-1]
+                merged.append(self._chunk_record(
+                    text,
+                    first.get("source_file"),
+                    first.get("page_number"),
+                    len(merged),
+                    self.count_tokens(text),
+                    page_end=last.get("page_end", last.get("page_number"))
+                ))
 
         for chunk in chunks:
-            if self.count_tokens(buffer) < min_tokens:
-                buffer += " " + chunk["text"]
+            if buffer_tokens < min_tokens:
+                parts.append(chunk)
             else:
-                merged.append(buffer.strip())
-                buffer = chunk["text"]
+                emit()
+                parts = [chunk]
+                buffer_tokens = 0
 
-        if buffer:
-            merged.append(buffer.strip())
+            token_count = chunk.get("token_count")
+            buffer_tokens += token_count if token_count is not None else self.count_tokens(chunk["text"])
+
+        if parts:
+            emit()
 
         return merged
 
@@ -61,12 +209,16 @@ class TextChunker:
         source_file: str,
         page_number: int,
         chunk_size=1000,
-        overlap=200
+        overlap=200,
+        tokens=None
     ):
         """
         Fixed-size token chunking with overlap
+        (tokens: text already encoded by the caller)
         """
-        tokens = self.encoder.encode(text)
+        if tokens is None:
+            tokens = self.encoder.encode(text)
+
         chunks = []
         start = 0
         chunk_index = 0
@@ -76,18 +228,9 @@ class TextChunker:
             chunk_tokens = tokens[start:end]
             chunk_text = self.encoder.decode(chunk_tokens)
 
-            chunk_data = {
-                "chunk_id": str(uuid.uuid4()),
-                "chunk_index": chunk_index,
-                "text": chunk_text,
-                "source_file": source_file,
-                "page_number": page_number,
-                "token_count": len(chunk_tokens),
-                "char_count": len(chunk_text),
-                "word_count": len(chunk_text.split())
-            }
-
-            chunks.append(chunk_data)
+            chunks.append(self._chunk_record(
+                chunk_text, source_file, page_number, chunk_index, len(chunk_tokens)
+            ))
 
             start += chunk_size - overlap
             chunk_index += 1
@@ -100,55 +243,171 @@ class TextChunker:
         source_file: str,
         page_number: int,
         max_tokens=1000,
-        overlap_tokens=200
+        overlap_tokens=200,
+        tokens=None
     ):
         """
-        Sentence-aware chunking that preserves semantic boundaries
+        Sentence-aware chunking that preserves semantic boundaries.
+
+        The page is encoded once (or tokens is reused) and sentence breaks
+        are mapped to token indexes, so chunks are cut by index arithmetic
+        (see _SpanPacker) with a real token overlap. Chunk text is sliced
+        from the page.
         """
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        if tokens is None:
+            tokens = self.encoder.encode(text)
+
+        offsets = self._token_offsets(text, tokens)
+        packer = _SpanPacker(max_tokens, overlap_tokens)
+        spans = []
+
+        for bound in self._sentence_bounds(text, offsets):
+            spans.extend(packer.add(bound))
+
+        spans.extend(packer.finish())
+
         chunks = []
-        current_chunk = ""
-        current_tokens = 0
+
+        for start, end in spans:
+            chunk_text = text[offsets[start]:offsets[end]].strip()
+            if chunk_text:
+                chunks.append(self._chunk_record(
+                    chunk_text, source_file, page_number, len(chunks), end - start
+                ))
+
+        return chunks
+
+    def _encode_pages(self, pages):
+        """
+        Yield (page_number, page_text, piece, tokens) for each non-empty
+        page: piece is the page text joined to the previous page with
+        PAGE_SEPARATOR, tokens its encoding. Pages are read and encoded
+        ENCODE_BATCH_PAGES at a time.
+        """
+        pages = iter(pages)
+        joined = False
+
+        while True:
+            batch = list(itertools.islice(pages, ENCODE_BATCH_PAGES))
+            if not batch:
+                return
+
+            kept = []
+            pieces = []
+
+            for page_number, page_text in batch:
+                if not page_text or not page_text.strip():
+                    continue
+                kept.append((page_number, page_text))
+                pieces.append(PAGE_SEPARATOR + page_text if joined else page_text)
+                joined = True
+
+            for (page_number, page_text), piece, tokens in zip(kept, pieces, self.encode_batch(pieces)):
+                yield page_number, page_text, piece, tokens
+
+    def chunk_document(
+        self,
+        pages,
+        source_file: str,
+        max_tokens=1000,
+        overlap_tokens=200
+    ):
+        """
+        Document-scope sentence chunking: text flows across page breaks,
+        so short pages share chunks and a sentence split by a page break
+        stays whole. pages is an iterable of (page_number, text) in order;
+        chunks are yielded as soon as they are complete, so pages can be
+        streamed.
+
+        Packing is the same as chunk_by_sentences (pages are encoded once,
+        ENCODE_BATCH_PAGES at a time with encode_batch). Besides
+        page_number (= page_start), every chunk records its span for
+        citations: page_start / char_start (offset in that page's text)
+        and page_end / char_end (exclusive offset in that page's text).
+        """
+        # Buffered document text from char_base on, with the character offset
+        # of each buffered token (token_base on) plus the end of the text
+        text = ""
+        offsets = [0]
+        char_base = 0
+        token_base = 0
+
+        # Document char offset where each buffered page starts, and its number
+        page_starts = []
+        page_numbers = []
+
+        packer = _SpanPacker(max_tokens, overlap_tokens)
         chunk_index = 0
 
-        for sentence in sentences:
-            sentence_tokens = self.count_tokens(sentence)
+        def make_chunk(span_start, span_end):
+            chunk_start = offsets[span_start - token_base]
+            chunk_end = offsets[span_end - token_base]
+            raw = text[chunk_start:chunk_end]
+            chunk_text = raw.strip()
+            if not chunk_text:
+                return None
 
-            if current_tokens + sentence_tokens <= max_tokens:
-                current_chunk += " " + sentence
-                current_tokens += sentence_tokens
-            else:
-                # Save current chunk
-                chunks.append({
-                    "chunk_id": str(uuid.uuid4()),
-                    "chunk_index": chunk_index,
-                    "text": current_chunk.strip(),
-                    "source_file": source_file,
-                    "page_number": page_number,
-                    "token_count": current_tokens,
-                    "char_count": len(current_chunk),
-                    "word_count": len(current_chunk.split())
-                })
-
-                # Start new chunk with overlap
-                overlap_text = current_chunk.split()[-overlap_tokens:]
-                current_chunk = " ".join(overlap_text) + " " + sentence
-                current_tokens = self.count_tokens(current_chunk)
-                chunk_index += 1
-
-        if current_chunk.strip():
-            chunks.append({
-                "chunk_id": str(uuid.uuid4()),
-                "chunk_index": chunk_index,
-                "text": current_chunk.strip(),
-                "source_file": source_file,
-                "page_number": page_number,
-                "token_count": current_tokens,
-                "char_count": len(current_chunk),
-                "word_count": len(current_chunk.split())
+            doc_start = char_base + chunk_start + (len(raw) - len(raw.lstrip()))
+            doc_end = doc_start + len(chunk_text)
+            first = bisect.bisect_right(page_starts, doc_start) - 1
+            last = bisect.bisect_right(page_starts, doc_end - 1) - 1
+
+            chunk = self._chunk_record(
+                chunk_text, source_file, page_numbers[first], chunk_index, span_end - span_start,
+                page_end=page_numbers[last]
+            )
+            chunk.update({
+                "page_start": page_numbers[first],
+                "page_end": page_numbers[last],
+                "char_start": doc_start - page_starts[first],
+                "char_end": doc_end - page_starts[last]
             })
+            return chunk
 
-        return chunks
+        def emit(spans):
+            nonlocal chunk_index
+            for span_start, span_end in spans:
+                chunk = make_chunk(span_start, span_end)
+                if chunk is not None:
+                    chunk_index += 1
+                    yield chunk
+
+        for page_number, page_text, piece, tokens in self._encode_pages(pages):
+            shift = len(text)
+
+            page_starts.append(char_base + shift + len(piece) - len(page_text))
+            page_numbers.append(page_number)
+
+            text += piece
+            piece_offsets = self._token_offsets(piece, tokens)
+            offsets.extend(offset + shift for offset in piece_offsets[1:])
+
+            # Breaks from the page join on (the lookbehind sees the previous page)
+            token_total = len(offsets) - 1
+            for match in _SENTENCE_BREAK_PATTERN.finditer(text, shift):
+                bound = bisect.bisect_left(offsets, match.start(), 0, token_total)
+                if token_base + bound > packer.end:
+                    yield from emit(packer.add(token_base + bound))
+
+            # Drop what no later chunk can reach: everything before its start
+            drop = packer.start - token_base
+            if drop > 0:
+                dropped_chars = offsets[drop]
+                text = text[dropped_chars:]
+                offsets = [offset - dropped_chars for offset in offsets[drop:]]
+                char_base += dropped_chars
+                token_base = packer.start
+
+                first = bisect.bisect_right(page_starts, char_base) - 1
+                if first > 0:
+                    del page_starts[:first]
+                    del page_numbers[:first]
+
+        # The end of the document ends the last sentence
+        token_total = token_base + len(offsets) - 1
+        if token_total > packer.end:
+            yield from emit(packer.add(token_total))
+        yield from emit(packer.finish())
 
     # --------------------------------------------------
     # Master Chunking Function
@@ -166,19 +425,23 @@ class TextChunker:
         if not text or not text.strip():
             return []
 
-        optimal_size = self.calculate_optimal_chunk_size(text)
+        # Encoded once; size selection and chunking share the tokens
+        tokens = self.encoder.encode(text)
+        optimal_size = self.calculate_optimal_chunk_size(text, total_tokens=len(tokens))
 
         if strategy == "sentences":
             return self.chunk_by_sentences(
                 text,
                 source_file,
                 page_number,
-                max_tokens=optimal_size
+                max_tokens=optimal_size,
+                tokens=tokens
             )
 
         return self.chunk_by_tokens(
             text,
             source_file,
             page_number,
-            chunk_size=optimal_size
+            chunk_size=optimal_size,
+            tokens=tokens
         )
@@ -0,0 +1,38 @@
+import os
+import threading
+
+import tiktoken
+
+
+# Threads for encode_batch; tiktoken releases the GIL while encoding
+TOKENIZER_THREADS = int(os.getenv("TOKENIZER_THREADS", min(8, os.cpu_count() or 1)))
+
+
+# -------------------------
+# Process-wide Encoder Registry
+# -------------------------
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model_name="gpt-3.5-turbo"):
+    """
+    Return the single tiktoken encoding for a model in this process.
+    Loaded on first use, so constructing chunkers and providers is free.
+    """
+    with _encoders_lock:
+        encoder = _encoders.get(model_name)
+        if encoder is None:
+            encoder = tiktoken.encoding_for_model(model_name)
+            _encoders[model_name] = encoder
+        return encoder
+
+
+def encode_batch(texts, model_name="gpt-3.5-turbo", num_threads=None):
+    """
+    Encode many texts at once across tiktoken's worker threads.
+    Returns one token list per text, in order.
+    """
+    return get_encoder(model_name).encode_batch(
+        list(texts), num_threads=num_threads or TOKENIZER_THREADS
+    )
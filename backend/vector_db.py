@@ -232,11 +232,12 @@ class VectorDatabase:
         embeddings -> vector list
         documents -> text chunks
         metadatas -> {source_file, page_number, chunk_id}
+        Written as an upsert: an existing ID is overwritten, not duplicated.
         """
         try:
             collection = self.create_collection()
 
-            collection.add(
+            collection.upsert(
                 ids=ids,
                 embeddings=embeddings,
                 documents=documents,
@@ -246,6 +247,20 @@ class VectorDatabase:
         except Exception as e:
             raise RuntimeError(f"❌ Failed to add documents: {e}")
 
+    def get_existing_ids(self, ids):
+        """
+        Subset of ids already stored in the collection.
+        """
+        if not ids:
+            return set()
+
+        try:
+            collection = self.create_collection()
+            results = collection.get(ids=list(ids), include=[])
+            return set(results["ids"])
+        except Exception as e:
+            raise RuntimeError(f"❌ Failed to look up document IDs: {e}")
+
     def update_document(self, doc_id, embedding=None, document=None, metadata=None):
         """
         Update an existing embedding/document/metadata by ID.
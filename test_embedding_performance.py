@@ -0,0 +1,67 @@
+import os
+import time
+import asyncio
+import tempfile
+
+# Offline by default: the perf suite measures our code, not the network
+os.environ.setdefault("EMBEDDING_PROVIDER", "local")
+
+from backend.embeddings import EmbeddingGenerator, close_async_sessions
+
+CHUNK_COUNTS = [100, 1000, 5000]
+
+sample_sentence = "SmartDocs splits documents into chunks and embeds every chunk for search. "
+
+
+def make_chunks(count, tag):
+    return [
+        {
+            "chunk_id": f"{tag}_{i}",
+            "chunk_index": i,
+            "text": f"{tag} chunk {i}. " + sample_sentence * 20,
+            "source_file": "perf.pdf",
+            "page_number": i // 5 + 1,
+            "token_count": 300
+        }
+        for i in range(count)
+    ]
+
+
+async def run_async(generator, chunks):
+    try:
+        return await generator.agenerate_batch_embeddings(chunks)
+    finally:
+        await close_async_sessions()
+
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    generator = EmbeddingGenerator(cache_path=os.path.join(cache_dir, "perf_cache.bin"))
+
+    for count in CHUNK_COUNTS:
+        print("\n" + "=" * 80)
+        print(f"Chunks: {count}")
+
+        chunks = make_chunks(count, f"sync{count}")
+
+        start = time.perf_counter()
+        generator.generate_batch_embeddings(chunks)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        generator.generate_batch_embeddings(chunks)
+        warm = time.perf_counter() - start
+
+        start = time.perf_counter()
+        asyncio.run(run_async(generator, make_chunks(count, f"async{count}")))
+        async_cold = time.perf_counter() - start
+
+        print(f"⏱ sync cold:  {cold:.3f}s ({count / cold:.0f} chunks/s)")
+        print(f"⏱ sync warm:  {warm:.3f}s ({count / warm:.0f} chunks/s, cache hits)")
+        print(f"⏱ async cold: {async_cold:.3f}s ({count / async_cold:.0f} chunks/s)")
+
+    metrics = generator.metrics_snapshot()
+    print("\n" + "=" * 80)
+    print(f"Requests: {metrics['requests']} (mean batch {metrics['batch_size']['mean']:.1f} inputs)")
+    print(f"Provider time: {metrics['request_latency_seconds']['sum']:.3f}s")
+    print(f"Rate-limit wait: {metrics['rate_limit_wait_seconds']:.3f}s, retries: {metrics['retries']}")
+    print(f"Cache hit ratio: {metrics['cache_hit_ratio']:.2%}")
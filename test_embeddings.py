@@ -1,5 +1,8 @@
 import time
 import json
+# Run with EMBEDDING_PROVIDER=local to test without an API key. TextChunker still
+# loads tiktoken's cl100k_base, so fully offline runs need TIKTOKEN_CACHE_DIR
+# pointing at a cache seeded on a networked machine.
 from backend.text_chunker import TextChunker
 from backend.embeddings import EmbeddingGenerator
 
@@ -9,15 +9,15 @@ for pdf_path in PDF_FILES:
     print(f"Processing: {pdf_path}")
 
     try:
-        processor = PDFProcessor(pdf_path)
+        # One session: metadata and text share a single open document
+        with PDFProcessor(pdf_path) as processor:
+            metadata = processor.get_pdf_metadata()
+            print("\nMetadata:")
+            for key, value in metadata.items():
+                print(f"{key}: {value}")
 
-        metadata = processor.get_pdf_metadata()
-        print("\nMetadata:")
-        for key, value in metadata.items():
-            print(f"{key}: {value}")
-
-        print("\nExtracting text using PyMuPDF...")
-        result = processor.extract_text_pymupdf()
+            print("\nExtracting text using PyMuPDF...")
+            result = processor.extract_text_pymupdf()
 
         for page, text in result["text_by_page"].items():
             print(f"\n--- Page {page} ---")
@@ -1,5 +1,10 @@
+import os
 from backend.search_engine import SearchEngine
 
+# Run with EMBEDDING_PROVIDER=local to test offline (no API key / network);
+# the collection must have been ingested with the same provider.
+USER = os.getenv("SMARTDOCS_TEST_USER", "test_user")
+
 queries = [
     "What is Task 1 about?",
     "Explain OpenAI API setup",
@@ -13,16 +18,16 @@ queries = [
     "What is the role of embeddings?"
 ]
 
-engine = SearchEngine()
+engine = SearchEngine(user=USER)
 
 for q in queries:
     print("\n" + "=" * 80)
     print("Query:", q)
 
-    results = engine.search_similar_chunks(q, k=5, threshold=0.7)
+    results = engine.search_similar_chunks(q, k=5)
 
     if not results:
-        print("❌ No relevant results found (below threshold)")
+        print("❌ No relevant results found")
         continue
 
     for r in results:
@@ -30,5 +35,4 @@ for q in queries:
         print("Score:", r["relevance_score"])
         print("File:", r["source_file"])
         print("Page:", r["page_number"])
-        print("Chunk Index:", r["chunk_index"])
         print("Text Preview:", r["chunk_text"][:200])
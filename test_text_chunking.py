@@ -37,3 +37,49 @@ for file, page, text in tests:
         print("Tokens:", chunk["token_count"])
         print("Words:", chunk["word_count"])
         print("Preview:", chunk["text"][:200])
+
+
+# -------------------------
+# Document-scope chunking across pages
+# -------------------------
+print("\n" + "=" * 80)
+print("Testing: multi_page.pdf (chunk_document)")
+
+pages = [
+    (1, "Page one opens the document. " * 40 + "This sentence continues"),
+    (2, "on page two and ends here. " + "Page two has its own sentences. " * 60),
+    (3, ""),
+    (4, "Page four is short."),
+    (5, "Page five is the last page of the document. " * 80)
+]
+page_texts = {page: text for page, text in pages if text.strip()}
+page_order = list(page_texts)
+
+max_tokens = 200
+chunks = list(chunker.chunk_document(pages, "multi_page.pdf", max_tokens=max_tokens, overlap_tokens=40))
+
+print(f"Total Chunks: {len(chunks)}")
+
+for chunk in chunks:
+    first, last = chunk["page_start"], chunk["page_end"]
+
+    # Rebuild the chunk from its span: start page from char_start, whole pages
+    # in between, end page up to char_end (pages are joined by a newline)
+    if first == last:
+        rebuilt = page_texts[first][chunk["char_start"]:chunk["char_end"]]
+    else:
+        rebuilt = "\n".join(
+            [page_texts[first][chunk["char_start"]:]]
+            + [page_texts[page] for page in page_order if first < page < last]
+            + [page_texts[last][:chunk["char_end"]]]
+        )
+
+    assert rebuilt == chunk["text"], f"Span of chunk {chunk['chunk_index']} does not match its text"
+    assert chunk["token_count"] <= max_tokens, f"Chunk {chunk['chunk_index']} has {chunk['token_count']} tokens"
+
+    print(f"Chunk {chunk['chunk_index']}: pages {first}-{last}, chars {chunk['char_start']}-{chunk['char_end']}, tokens {chunk['token_count']}")
+
+assert any(chunk["page_start"] != chunk["page_end"] for chunk in chunks), "No chunk crossed a page break"
+assert chunks[-1]["page_end"] == 5
+
+print("All chunk spans rebuild their text")
@@ -0,0 +1,80 @@
+import os
+import time
+import random
+
+from backend.text_cleaner import TextCleaner
+
+PAGE_COUNTS = [100, 1000, 5000]
+
+# Building blocks covering every cleaning rule: whitespace runs, tabs,
+# unicode, special characters, page numbers and separator lines
+FRAGMENTS = [
+    "The   quick\tbrown fox", "JUMPS over", "the lazy dog.", "Page 12", "page12", "  42  ",
+    "---", "-----", "___", "===", "###", "café naïve résumé", "ﬁnancial ① ½", "$$$%%%",
+    "Section 3.1: (Overview)", "e-mail: a@b.com", " non-breaking spaces", "\r\n",
+    "\n", "\n\n\n", "  ", "\t\t", "“quoted” text", "— dash —", "PAGE 7 of 9", "1 2 3",
+]
+
+
+def make_page(rng, index):
+    parts = [f"Page {index}\n"]
+    for _ in range(400):
+        parts.append(rng.choice(FRAGMENTS))
+        parts.append(rng.choice([" ", "\n", "", "  "]))
+    return "".join(parts)
+
+
+def reference_clean(cleaner, text):
+    """
+    The original four-pass pipeline, built from the individual steps.
+    """
+    if not text or not text.strip():
+        return ""
+
+    text = cleaner.remove_extra_whitespace(text)
+    text = cleaner.remove_special_characters(text)
+    text = cleaner.remove_headers_footers(text)
+    text = cleaner.normalize_text(text)
+
+    return text
+
+
+cleaner = TextCleaner()
+rng = random.Random(0)
+
+for count in PAGE_COUNTS:
+    pages = [make_page(rng, i) for i in range(count)]
+
+    start = time.perf_counter()
+    expected = [reference_clean(cleaner, page) for page in pages]
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cleaned = [cleaner.clean_text(page) for page in pages]
+    fused_time = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(expected, cleaned))
+
+    print("\n" + "=" * 80)
+    print(f"Pages: {count} ({sum(map(len, pages)) / 1e6:.1f}M chars)")
+    print(f"⏱ four-pass: {reference_time:.3f}s")
+    print(f"⏱ fused:     {fused_time:.3f}s ({reference_time / fused_time:.1f}x)")
+    print(f"Identical output: {mismatches == 0} ({mismatches} mismatches)")
+
+    assert mismatches == 0, "clean_text output differs from the four-pass pipeline"
+
+    start = time.perf_counter()
+    batch = cleaner.clean_pages(pages)
+    batch_time = time.perf_counter() - start
+
+    print(f"⏱ clean_pages ({os.cpu_count()} cores): {batch_time:.3f}s ({fused_time / batch_time:.1f}x)")
+
+    assert batch == cleaned, "clean_pages output differs from clean_text"
+
+    start = time.perf_counter()
+    streamed = list(cleaner.iter_clean_pages(enumerate(pages, start=1)))
+    stream_time = time.perf_counter() - start
+
+    print(f"⏱ iter_clean_pages ({os.cpu_count()} cores): {stream_time:.3f}s ({fused_time / stream_time:.1f}x)")
+
+    assert streamed == list(enumerate(cleaned, start=1)), "iter_clean_pages output differs from clean_text"